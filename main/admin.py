@@ -1,7 +1,7 @@
 from django.contrib import admin
 from .models import (
-    YearlyGoal, QuarterlyGoal, KPI, KPIRecord, 
-    UserProfile, Vision, RICHItem, JournalEntry
+    YearlyGoal, QuarterlyGoal, KPI, KPIRecord, KPIRollup,
+    UserProfile, Vision, RICHItem, JournalEntry, WebhookOutbox
 )
 
 @admin.register(Vision)
@@ -40,6 +40,11 @@ class KPIRecordAdmin(admin.ModelAdmin):
     list_filter = ('entry_date',)
     search_fields = ('notes',)
 
+@admin.register(KPIRollup)
+class KPIRollupAdmin(admin.ModelAdmin):
+    list_display = ('kpi', 'granularity', 'period_start', 'sum_value', 'count')
+    list_filter = ('granularity',)
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'role', 'phone')
@@ -50,5 +55,11 @@ class UserProfileAdmin(admin.ModelAdmin):
 class JournalEntryAdmin(admin.ModelAdmin):
     list_display = ['user', 'created_at', 'updated_at']
     list_filter = ['user', 'created_at']
-    search_fields = ['content_html']
+    search_fields = ['content_text']
+    ordering = ['-created_at']
+
+@admin.register(WebhookOutbox)
+class WebhookOutboxAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'attempts', 'created_at', 'processed_at']
+    list_filter = ['status']
     ordering = ['-created_at']
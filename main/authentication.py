@@ -0,0 +1,24 @@
+"""
+JWT authentication that loads the user and its profile in one query.
+
+Most API views read request.user.profile, which would otherwise cost a second
+query per request. The user is still read fresh on every request and goes
+through all of simplejwt's checks (inactive users, CHECK_REVOKE_TOKEN), so a
+deactivated user or a changed password takes effect immediately in every
+process.
+"""
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+class _UsersWithProfile:
+    """The bits of the user model simplejwt's get_user touches, joined to the profile"""
+
+    def __init__(self, user_model):
+        self.objects = user_model.objects.select_related('profile')
+        self.DoesNotExist = user_model.DoesNotExist
+
+
+class ProfileJWTAuthentication(JWTAuthentication):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_model = _UsersWithProfile(self.user_model)
@@ -0,0 +1,26 @@
+"""
+Per-user change counters used to version cached API payloads.
+
+Every write to a user's goals, KPIs, records, journal or RICH items bumps the
+user's version (see the signals in models.py), which implicitly invalidates
+every cache entry keyed on the old version. The counter is a database row
+(UserDataVersion), so a write made by any process invalidates the payloads
+cached by every other one; only the payloads themselves live in the cache.
+"""
+from .models import UserDataVersion
+
+DASHBOARD_CACHE_TIMEOUT = 300
+
+
+def get_user_version(user_id):
+    """Return the current change counter of a user"""
+    return UserDataVersion.current(user_id)
+
+
+def bump_user_version(user_id):
+    """Invalidate every payload cached for a user"""
+    return UserDataVersion.bump(user_id)
+
+
+def dashboard_cache_key(user_id):
+    return f'dashboard:{user_id}:{get_user_version(user_id)}'
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from main.outbox import MAX_ATTEMPTS, process_batch
+
+
+class Command(BaseCommand):
+    help = 'Turn queued journal webhook payloads into journal entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep between polls when the outbox is empty')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = process_batch(options['batch_size'], options['max_attempts'])
+            total += handled
+            if handled:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} webhook payloads'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from main.models import KPIRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily/weekly/monthly KPI rollup table from raw KPI records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kpi', type=int, action='append', dest='kpi_ids',
+                            help='Only rebuild this KPI id (may be repeated)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = KPIRollup.rebuild(kpi_ids=options['kpi_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} KPI rollups'))
@@ -0,0 +1,15 @@
+from django.middleware.gzip import GZipMiddleware
+
+
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware for buffered responses only. Django compresses streamed
+    bodies as one gzip stream that is only flushed when the generator ends,
+    which would hold back SSE events, NDJSON progress lines and exports
+    until the response closes.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        return super().process_response(request, response)
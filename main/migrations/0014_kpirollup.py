@@ -0,0 +1,64 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:51
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    KPIRecord = apps.get_model('main', 'KPIRecord')
+    KPIRollup = apps.get_model('main', 'KPIRollup')
+
+    periods = {}
+    records = KPIRecord.objects.order_by('kpi_id', 'entry_date').values_list(
+        'kpi_id', 'entry_date', 'value')
+    for kpi_id, day, value in records.iterator():
+        week = day - timedelta(days=day.weekday())
+        for key in ((kpi_id, 'daily', day), (kpi_id, 'weekly', week),
+                    (kpi_id, 'monthly', day.replace(day=1))):
+            rollup = periods.get(key)
+            if rollup is None:
+                periods[key] = KPIRollup(
+                    kpi_id=kpi_id, granularity=key[1], period_start=key[2],
+                    sum_value=value, min_value=value, max_value=value, count=1,
+                    last_value=value, last_entry_date=day,
+                )
+            else:
+                rollup.sum_value += value
+                rollup.min_value = min(rollup.min_value, value)
+                rollup.max_value = max(rollup.max_value, value)
+                rollup.count += 1
+                rollup.last_value = value
+                rollup.last_entry_date = day
+    KPIRollup.objects.bulk_create(periods.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_alter_kpirecord_options_alter_kpirecord_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KPIRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=20)),
+                ('period_start', models.DateField()),
+                ('sum_value', models.FloatField(default=0)),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_value', models.FloatField()),
+                ('last_entry_date', models.DateField()),
+                ('kpi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='main.kpi')),
+            ],
+            options={
+                'ordering': ['kpi', 'granularity', 'period_start'],
+                'unique_together': {('kpi', 'granularity', 'period_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
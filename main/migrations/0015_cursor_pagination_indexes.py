@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_kpirollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='journalentry_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='kpirecord',
+            index=models.Index(fields=['-entry_date', '-id'], name='kpirecord_entry_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quarterlygoal',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='quarterlygoal_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='yearlygoal',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='yearlygoal_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:55
+
+from django.db import migrations, models
+
+from main.text import html_to_text
+
+
+def backfill_content_text(apps, schema_editor):
+    JournalEntry = apps.get_model('main', 'JournalEntry')
+    entries = []
+    for entry in JournalEntry.objects.only('id', 'content_html').iterator():
+        entry.content_text = html_to_text(entry.content_html)
+        entries.append(entry)
+    JournalEntry.objects.bulk_update(entries, ['content_text'], batch_size=500)
+
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX journalentry_content_fts_idx ON main_journalentry "
+    "USING gin (to_tsvector('english', content_text))",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS journalentry_content_fts_idx",
+]
+
+# FTS5 shadow table over content_text, kept in sync by triggers
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE main_journalentry_fts USING fts5("
+    "content_text, content='main_journalentry', content_rowid='id')",
+    "CREATE TRIGGER main_journalentry_fts_ai AFTER INSERT ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(rowid, content_text) VALUES (new.id, new.content_text); END",
+    "CREATE TRIGGER main_journalentry_fts_ad AFTER DELETE ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts, rowid, content_text) "
+    "VALUES ('delete', old.id, old.content_text); END",
+    "CREATE TRIGGER main_journalentry_fts_au AFTER UPDATE ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts, rowid, content_text) "
+    "VALUES ('delete', old.id, old.content_text); "
+    "INSERT INTO main_journalentry_fts(rowid, content_text) VALUES (new.id, new.content_text); END",
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_ai",
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_ad",
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_au",
+    "DROP TABLE IF EXISTS main_journalentry_fts",
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='content_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(backfill_content_text, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:57
+
+from django.db import migrations, models
+
+from main.text import make_excerpt, word_count
+
+
+def backfill_excerpts(apps, schema_editor):
+    JournalEntry = apps.get_model('main', 'JournalEntry')
+    entries = []
+    for entry in JournalEntry.objects.only('id', 'content_text').iterator():
+        entry.excerpt = make_excerpt(entry.content_text)
+        entry.word_count = word_count(entry.content_text)
+        entries.append(entry)
+    JournalEntry.objects.bulk_update(entries, ['excerpt', 'word_count'], batch_size=500)
+
+
+# Adding columns rebuilds the table on SQLite, which drops the FTS5 sync
+# triggers created in 0016; put them back.
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_ai",
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_ad",
+    "DROP TRIGGER IF EXISTS main_journalentry_fts_au",
+    "CREATE TRIGGER main_journalentry_fts_ai AFTER INSERT ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(rowid, content_text) VALUES (new.id, new.content_text); END",
+    "CREATE TRIGGER main_journalentry_fts_ad AFTER DELETE ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts, rowid, content_text) "
+    "VALUES ('delete', old.id, old.content_text); END",
+    "CREATE TRIGGER main_journalentry_fts_au AFTER UPDATE ON main_journalentry BEGIN "
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts, rowid, content_text) "
+    "VALUES ('delete', old.id, old.content_text); "
+    "INSERT INTO main_journalentry_fts(rowid, content_text) VALUES (new.id, new.content_text); END",
+    "INSERT INTO main_journalentry_fts(main_journalentry_fts) VALUES ('rebuild')",
+]
+
+
+def restore_sqlite_fts_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_webhookoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_sqlite_fts_triggers, migrations.RunPython.noop),
+        migrations.RunPython(backfill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0019_userdataversion'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='kpirecord',
+            name='kpirecord_entry_date_idx',
+        ),
+    ]
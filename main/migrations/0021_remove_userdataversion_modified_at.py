@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0020_remove_kpirecord_entry_date_idx'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userdataversion',
+            name='modified_at',
+        ),
+    ]
@@ -1,11 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils.timezone import now, timedelta
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from simple_history.models import HistoricalRecords
-from django.db.models import F
+from .text import EXCERPT_LENGTH, html_to_text, make_excerpt, word_count
+from django.db.models import F, Q, Window, QuerySet, Count, Exists, OuterRef, Subquery
+from django.db.models.functions import RowNumber, Coalesce
 
 # ----------------------------------------------------------------------------------
 # PGOS (SINGLE ROLE & PHONE)
@@ -36,6 +38,9 @@ class YearlyGoal(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='yearlygoal_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s {self.get_life_sector_display()} Goal"
@@ -49,6 +54,23 @@ class YearlyGoal(models.Model):
         """API helper to get related quarterly goals"""
         return self.quarterlygoal_set.all()
 
+class QuarterlyGoalQuerySet(models.QuerySet):
+    def with_progress(self):
+        """
+        Annotate total_kpis and completed_kpis with correlated subqueries so a
+        list of goals needs no per-goal COUNT queries.
+        """
+        kpis = KPI.objects.filter(quarterly_goal=OuterRef('pk')).order_by().values('quarterly_goal')
+        completed = kpis.filter(Exists(KPIRollup.objects.filter(
+            kpi=OuterRef('pk'),
+            granularity='monthly',
+            max_value__gte=OuterRef('target_value')
+        )))
+        return self.annotate(
+            total_kpis=Coalesce(Subquery(kpis.annotate(n=Count('id')).values('n')), 0),
+            completed_kpis=Coalesce(Subquery(completed.annotate(n=Count('id')).values('n')), 0),
+        )
+
 class QuarterlyGoal(models.Model):
     """
     Breaks a YearlyGoal into smaller quarter-focused goals.
@@ -74,8 +96,13 @@ class QuarterlyGoal(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     history = HistoricalRecords()
 
+    objects = QuarterlyGoalQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='quarterlygoal_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s Q{self.quarter} {self.life_sector} Goal"
@@ -94,10 +121,20 @@ class QuarterlyGoal(models.Model):
 
     def get_progress(self):
         """Calculate and return progress metrics for this goal"""
+        # Use the with_progress() annotations when the queryset provided them
+        if hasattr(self, 'total_kpis') and hasattr(self, 'completed_kpis'):
+            return {
+                'total_kpis': self.total_kpis,
+                'completed_kpis': self.completed_kpis
+            }
         kpis = self.get_kpis()
+        # Monthly rollups carry each period's max, so this scans O(months) rows
         return {
             'total_kpis': kpis.count(),
-            'completed_kpis': kpis.filter(records__value__gte=F('target_value')).distinct().count()
+            'completed_kpis': kpis.filter(
+                rollups__granularity='monthly',
+                rollups__max_value__gte=F('target_value')
+            ).distinct().count()
         }
 
 class KPI(models.Model):
@@ -132,13 +169,20 @@ class KPI(models.Model):
     def __str__(self):
         return f"{self.name} ({self.frequency})"
 
+    RECENT_RECORDS_LIMIT = 7
+
     def get_recent_records(self):
         """Return recent KPI records"""
-        return self.records.all().order_by('-entry_date')[:7]
+        return self.records.all().order_by('-entry_date')[:self.RECENT_RECORDS_LIMIT]
 
-    def get_progress(self):
-        """Calculate and return progress metrics"""
-        records = self.get_recent_records()
+    def get_progress(self, records=None):
+        """
+        Calculate and return progress metrics.
+        `records` may be a pre-fetched list of recent records (newest first),
+        e.g. from KPIRecord.recent_for_kpis(), to avoid another query.
+        """
+        if records is None:
+            records = self.get_recent_records()
         if not records:
             return {
                 'current_value': 0,
@@ -165,11 +209,212 @@ class KPIRecord(models.Model):
     class Meta:
         ordering = ['-entry_date']
         # Add unique constraint to prevent multiple records for same KPI and date
+        # Also the index behind the records list: the user's KPIs are found
+        # through KPI.user and each one's records are already ordered by date
         unique_together = ['kpi', 'entry_date']
 
     def __str__(self):
         return f"{self.kpi.name} - {self.entry_date}: {self.value}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored date so rollups of the old period can be refreshed
+        instance._loaded_entry_date = instance.__dict__.get('entry_date')
+        return instance
+
+    @classmethod
+    def recent_for_kpis(cls, kpi_ids, limit=KPI.RECENT_RECORDS_LIMIT):
+        """
+        Fetch the latest `limit` records of every KPI in `kpi_ids` with a single
+        windowed query. Returns a dict of kpi_id -> list of records, newest first.
+        """
+        kpi_ids = list(kpi_ids)
+        recent = {kpi_id: [] for kpi_id in kpi_ids}
+        if not kpi_ids:
+            return recent
+
+        records = cls.objects.filter(kpi_id__in=kpi_ids).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('kpi_id')],
+                order_by=F('entry_date').desc(),
+            )
+        ).filter(row_number__lte=limit).order_by('kpi_id', '-entry_date')
+
+        for record in records:
+            recent[record.kpi_id].append(record)
+        return recent
+
+
+class KPIRollup(models.Model):
+    """
+    Pre-aggregated KPI records for one daily, weekly or monthly period.
+    Kept in sync by the KPIRecord signals below; rebuild from scratch with
+    `python manage.py rebuild_kpi_rollups`.
+    """
+    GRANULARITY_CHOICES = KPI.FREQUENCY_CHOICES
+    GRANULARITIES = [choice[0] for choice in GRANULARITY_CHOICES]
+
+    kpi = models.ForeignKey(KPI, related_name='rollups', on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=20, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    sum_value = models.FloatField(default=0)
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    count = models.PositiveIntegerField(default=0)
+    last_value = models.FloatField()
+    last_entry_date = models.DateField()
+
+    class Meta:
+        ordering = ['kpi', 'granularity', 'period_start']
+        unique_together = ['kpi', 'granularity', 'period_start']
+
+    def __str__(self):
+        return f"{self.kpi.name} - {self.granularity} {self.period_start}: {self.sum_value}"
+
+    @staticmethod
+    def period_bounds(granularity, day):
+        """Return the (start, end) dates of the period containing `day`, end exclusive"""
+        if granularity == 'daily':
+            return day, day + timedelta(days=1)
+        if granularity == 'weekly':
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7)
+        if granularity == 'monthly':
+            start = day.replace(day=1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    @classmethod
+    def summarize(cls, kpi_id, granularity, period_start, records):
+        """Build an unsaved rollup from records ordered by entry_date"""
+        values = [record.value for record in records]
+        return cls(
+            kpi_id=kpi_id,
+            granularity=granularity,
+            period_start=period_start,
+            sum_value=sum(values),
+            min_value=min(values),
+            max_value=max(values),
+            count=len(values),
+            last_value=records[-1].value,
+            last_entry_date=records[-1].entry_date,
+        )
+
+    @classmethod
+    def save_rollups(cls, rollups):
+        return cls.objects.bulk_create(
+            rollups,
+            update_conflicts=True,
+            unique_fields=['kpi', 'granularity', 'period_start'],
+            update_fields=['sum_value', 'min_value', 'max_value', 'count',
+                           'last_value', 'last_entry_date'],
+        )
+
+    @classmethod
+    def refresh(cls, entries):
+        """
+        Recompute every rollup period touched by `entries`, an iterable of
+        (kpi_id, entry_date) pairs. Costs one read, one upsert and one delete
+        whatever the number of entries.
+        """
+        periods = {}
+        for kpi_id, day in set(entries):
+            for granularity in cls.GRANULARITIES:
+                start, end = cls.period_bounds(granularity, day)
+                periods[(kpi_id, granularity, start)] = end
+        if not periods:
+            return
+
+        # Read the records of all touched periods in one query
+        windows = {}
+        for (kpi_id, granularity, start), end in periods.items():
+            low, high = windows.get(kpi_id, (start, end))
+            windows[kpi_id] = (min(low, start), max(high, end))
+        window_filter = Q()
+        for kpi_id, (low, high) in windows.items():
+            window_filter |= Q(kpi_id=kpi_id, entry_date__gte=low, entry_date__lt=high)
+        records = {}
+        for record in KPIRecord.objects.filter(window_filter).order_by('entry_date').only(
+                'kpi_id', 'entry_date', 'value'):
+            records.setdefault(record.kpi_id, []).append(record)
+
+        rollups = []
+        stale = Q()
+        for (kpi_id, granularity, start), end in periods.items():
+            members = [r for r in records.get(kpi_id, []) if start <= r.entry_date < end]
+            if members:
+                rollups.append(cls.summarize(kpi_id, granularity, start, members))
+            else:
+                stale |= Q(kpi_id=kpi_id, granularity=granularity, period_start=start)
+
+        if rollups:
+            cls.save_rollups(rollups)
+        if stale:
+            cls.objects.filter(stale).delete()
+
+    @classmethod
+    def rebuild(cls, kpi_ids=None, batch_size=1000):
+        """
+        Drop and rebuild the rollups of the given KPIs (all KPIs by default)
+        in one ordered pass over their records. Returns the number of rollups.
+        """
+        records = KPIRecord.objects.order_by('kpi_id', 'entry_date').only(
+            'kpi_id', 'entry_date', 'value')
+        existing = cls.objects.all()
+        if kpi_ids is not None:
+            records = records.filter(kpi_id__in=kpi_ids)
+            existing = existing.filter(kpi_id__in=kpi_ids)
+
+        total = 0
+        with transaction.atomic():
+            existing.delete()
+            pending = []
+            buckets = {}
+            for record in records.iterator(chunk_size=batch_size):
+                for granularity in cls.GRANULARITIES:
+                    start, _ = cls.period_bounds(granularity, record.entry_date)
+                    key = (record.kpi_id, granularity)
+                    bucket = buckets.get(key)
+                    if bucket and bucket[0] != start:
+                        pending.append(cls.summarize(record.kpi_id, granularity, *bucket))
+                        bucket = None
+                    if bucket is None:
+                        bucket = buckets[key] = (start, [])
+                    bucket[1].append(record)
+                if len(pending) >= batch_size:
+                    cls.objects.bulk_create(pending)
+                    total += len(pending)
+                    pending = []
+            for (kpi_id, granularity), bucket in buckets.items():
+                pending.append(cls.summarize(kpi_id, granularity, *bucket))
+            cls.objects.bulk_create(pending, batch_size=batch_size)
+            total += len(pending)
+        return total
+
+
+# ----------------------------------------------------------------------------------
+# KPI ROLLUP SIGNALS
+# ----------------------------------------------------------------------------------
+@receiver(post_save, sender=KPIRecord)
+def refresh_rollups_on_save(sender, instance, **kwargs):
+    entries = [(instance.kpi_id, instance.entry_date)]
+    loaded_date = getattr(instance, '_loaded_entry_date', None)
+    if loaded_date and loaded_date != instance.entry_date:
+        entries.append((instance.kpi_id, loaded_date))
+    KPIRollup.refresh(entries)
+    instance._loaded_entry_date = instance.entry_date
+
+
+@receiver(post_delete, sender=KPIRecord)
+def refresh_rollups_on_delete(sender, instance, origin=None, **kwargs):
+    # Deleting a KPI (or its user) cascades to its rollups as well
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not KPIRecord:
+        return
+    KPIRollup.refresh([(instance.kpi_id, instance.entry_date)])
+
 
 # ----------------------------------------------------------------------------------
 # USER PROFILE (SINGLE ROLE & PHONE)
@@ -201,6 +446,27 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.role}"
 
+    TRACKED_FIELDS = ('role', 'phone')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: instance.__dict__.get(field) for field in cls.TRACKED_FIELDS
+        }
+        return instance
+
+    def has_changes(self):
+        """True for unsaved profiles or when a tracked field differs from the database"""
+        loaded = getattr(self, '_loaded_values', None)
+        if self.pk is None or loaded is None:
+            return True
+        return any(getattr(self, field) != value for field, value in loaded.items())
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {field: getattr(self, field) for field in self.TRACKED_FIELDS}
+
     def has_minimum_role(self, required_role):
         """
         Utility that returns True if this user's role is >= the required role in hierarchy.
@@ -223,7 +489,12 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    # Only write the profile when it was loaded and modified in memory, so
+    # routine saves such as last_login updates don't touch it
+    if User.profile.is_cached(instance):
+        profile = instance.profile
+        if profile.has_changes():
+            profile.save()
 
 
 # Add these new models to the existing models.py
@@ -273,12 +544,116 @@ class JournalEntry(models.Model):
     Represents a journal entry with rich text content
     """
     content_html = models.TextField()
+    # Plain-text copy of content_html, indexed for full-text search (see search.py)
+    content_text = models.TextField(blank=True, editable=False)
+    # Derived at save time so list views never need to load content_html
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
     class Meta:
         ordering = ['-created_at']  # Show newest entries first
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='journalentry_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username}'s Entry - {self.created_at}"
+
+    def save(self, *args, **kwargs):
+        self.content_text = html_to_text(self.content_html)
+        self.excerpt = make_excerpt(self.content_text)
+        self.word_count = word_count(self.content_text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content_html' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'content_text', 'excerpt', 'word_count'}
+        super().save(*args, **kwargs)
+
+
+class WebhookOutbox(models.Model):
+    """
+    Raw webhook payloads accepted by journal_webhook and waiting to be turned
+    into journal entries by `python manage.py process_journal_outbox`.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('dead', 'Dead letter'),
+    ]
+
+    payload = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='webhookoutbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Webhook {self.id} ({self.status})"
+
+class UserDataVersion(models.Model):
+    """
+    Per-user change counter behind the cached dashboard and the ETags of
+    list/detail endpoints (see cache.py). Kept in the database so writes from
+    every process (gunicorn workers, the outbox and extraction workers, the
+    shell, the admin) are seen by all of them.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='data_version')
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id} v{self.version}"
+
+    @classmethod
+    def current(cls, user_id):
+        """Version of a user's data; 0 before their first write"""
+        return cls.objects.filter(user_id=user_id).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, user_id):
+        """Increment the counter atomically in the database and return the new version"""
+        if not cls.objects.filter(user_id=user_id).update(version=F('version') + 1):
+            _, created = cls.objects.get_or_create(user_id=user_id, defaults={'version': 1})
+            if not created:
+                # Lost the race to create the row; count this write on top of it
+                cls.objects.filter(user_id=user_id).update(version=F('version') + 1)
+        return cls.current(user_id)
+
+
+# ----------------------------------------------------------------------------------
+# USER VERSION SIGNALS (cached dashboard, ETags of list/detail endpoints)
+# ----------------------------------------------------------------------------------
+@receiver(post_save, sender=YearlyGoal)
+@receiver(post_delete, sender=YearlyGoal)
+@receiver(post_save, sender=QuarterlyGoal)
+@receiver(post_delete, sender=QuarterlyGoal)
+@receiver(post_save, sender=KPI)
+@receiver(post_delete, sender=KPI)
+@receiver(post_save, sender=JournalEntry)
+@receiver(post_delete, sender=JournalEntry)
+@receiver(post_save, sender=RICHItem)
+@receiver(post_delete, sender=RICHItem)
+@receiver(post_save, sender=Vision)
+@receiver(post_delete, sender=Vision)
+def bump_version_on_change(sender, instance, **kwargs):
+    UserDataVersion.bump(instance.user_id)
+
+
+@receiver(post_save, sender=KPIRecord)
+@receiver(post_delete, sender=KPIRecord)
+def bump_version_on_record_change(sender, instance, origin=None, **kwargs):
+    # Cascades from a KPI or user delete are covered by the KPI signal
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not KPIRecord:
+        return
+    UserDataVersion.bump(instance.kpi.user_id)
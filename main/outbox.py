@@ -0,0 +1,73 @@
+"""
+Draining of the journal webhook outbox (see WebhookOutbox).
+"""
+import json
+import logging
+from django.db import transaction
+from django.utils import timezone
+from django.utils.timezone import timedelta
+
+from .models import JournalEntry, WebhookOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = timedelta(seconds=30)
+
+# Use user ID 1 for now (update this based on your needs)
+WEBHOOK_USER_ID = 1
+
+
+class PermanentError(Exception):
+    """A payload that can never succeed and goes straight to the dead letters"""
+
+
+def handle_payload(raw_payload):
+    try:
+        data = json.loads(raw_payload)
+    except json.JSONDecodeError as e:
+        raise PermanentError(f"Invalid JSON payload: {e}")
+
+    content_html = data.get('content_html') if isinstance(data, dict) else None
+    if not content_html:
+        raise PermanentError("Missing content_html in payload")
+
+    return JournalEntry.objects.create(user_id=WEBHOOK_USER_ID, content_html=content_html)
+
+
+def process_batch(batch_size=50, max_attempts=MAX_ATTEMPTS):
+    """
+    Process up to `batch_size` due outbox rows. Failed rows are retried with
+    exponential backoff and dead-lettered after `max_attempts`.
+    Returns the number of rows handled.
+    """
+    with transaction.atomic():
+        rows = list(
+            WebhookOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=timezone.now())
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        for row in rows:
+            row.attempts += 1
+            try:
+                with transaction.atomic():
+                    entry = handle_payload(row.payload)
+                row.status = 'done'
+                row.last_error = ''
+                row.processed_at = timezone.now()
+                logger.info(f"Created journal entry {entry.id} from webhook {row.id}")
+            except PermanentError as e:
+                row.status = 'dead'
+                row.last_error = str(e)
+                logger.error(f"Dead-lettered webhook {row.id}: {e}")
+            except Exception as e:
+                row.last_error = str(e)
+                if row.attempts >= max_attempts:
+                    row.status = 'dead'
+                    logger.error(f"Dead-lettered webhook {row.id} after {row.attempts} attempts: {e}")
+                else:
+                    row.available_at = timezone.now() + RETRY_BASE_DELAY * 2 ** (row.attempts - 1)
+                    logger.warning(f"Webhook {row.id} failed (attempt {row.attempts}), retrying: {e}")
+        WebhookOutbox.objects.bulk_update(
+            rows, ['status', 'attempts', 'last_error', 'available_at', 'processed_at'])
+    return len(rows)
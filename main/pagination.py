@@ -0,0 +1,104 @@
+from django.db.models import Q
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination on a two-column key such as (created_at, id).
+
+    DRF's CursorPagination positions on ordering[0] alone and steps over rows
+    sharing that value with an OFFSET. Here the cursor carries both columns
+    and pages are selected with (a, b) < (x, y), so positions are unique,
+    offsets stay 0 and every page is the same index range scan however many
+    rows tie on the first column. `?limit=` sets the page size.
+    """
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            queryset = queryset.filter(self._after(current_position, reverse))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _after(self, position, reverse):
+        """Rows strictly past `position` in the direction being paged"""
+        value, tie = position.rsplit('|', 1)
+        (first, second) = self.ordering[:2]
+        lookup = 'lt' if reverse != first.startswith('-') else 'gt'
+        first, second = first.lstrip('-'), second.lstrip('-')
+        return (Q(**{f'{first}__{lookup}': value}) |
+                Q(**{first: value, f'{second}__{lookup}': tie}))
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for field in ordering[:2]:
+            field_name = field.lstrip('-')
+            if isinstance(instance, dict):
+                values.append(instance[field_name])
+            else:
+                values.append(getattr(instance, field_name))
+        return '|'.join(str(value) for value in values)
+
+
+class CreatedAtCursorPagination(KeysetCursorPagination):
+    """Keyset pagination on (created_at, id), newest first"""
+    ordering = ('-created_at', '-id')
+
+
+class EntryDateCursorPagination(KeysetCursorPagination):
+    """Keyset pagination on (entry_date, id), most recent entry first"""
+    ordering = ('-entry_date', '-id')
+
+
+class HistoryCursorPagination(KeysetCursorPagination):
+    """Keyset pagination over django-simple-history rows, newest change first"""
+    ordering = ('-history_date', '-history_id')
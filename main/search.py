@@ -0,0 +1,95 @@
+"""
+Ranked full-text search over journal entries.
+
+Entries store a plain-text copy of their HTML (`JournalEntry.content_text`).
+On PostgreSQL it is matched through a GIN index on its tsvector, on SQLite
+through the `main_journalentry_fts` FTS5 table that triggers keep in sync
+(both created by migration 0016). Other databases fall back to icontains.
+Note that SQLite migrations which rebuild main_journalentry drop those
+triggers, so such a migration has to recreate them (see 0018).
+"""
+import re
+from django.db import connection
+from django.utils.html import escape
+
+from .models import JournalEntry
+
+# Private-use markers around matches; the snippet is HTML-escaped before they
+# become <mark> tags so entry text can never inject markup.
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+
+FTS_TABLE = 'main_journalentry_fts'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _highlight(snippet):
+    return escape(snippet or '').replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>')
+
+
+def _search_postgresql(user_id, query, limit, offset):
+    sql = f"""
+        SELECT id, created_at, rank,
+               ts_headline('english', content_text, q,
+                           'StartSel={MATCH_START}, StopSel={MATCH_END}, MaxFragments=2, MaxWords=20, MinWords=5')
+        FROM (
+            SELECT e.id, e.created_at, e.content_text, q,
+                   ts_rank(to_tsvector('english', e.content_text), q) AS rank
+            FROM main_journalentry e, websearch_to_tsquery('english', %s) q
+            WHERE e.user_id = %s AND to_tsvector('english', e.content_text) @@ q
+            ORDER BY rank DESC, e.id DESC
+            LIMIT %s OFFSET %s
+        ) ranked
+        ORDER BY rank DESC, id DESC
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, user_id, limit, offset])
+        return cursor.fetchall()
+
+
+def _search_sqlite(user_id, query, limit, offset):
+    # Quote every term so user input is never parsed as FTS5 syntax
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return []
+    match = ' '.join(f'"{term}"' for term in terms)
+    sql = f"""
+        SELECT e.id, e.created_at, -bm25({FTS_TABLE}) AS rank,
+               snippet({FTS_TABLE}, 0, '{MATCH_START}', '{MATCH_END}', '…', 16)
+        FROM {FTS_TABLE}
+        JOIN main_journalentry e ON e.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND e.user_id = %s
+        ORDER BY bm25({FTS_TABLE}), e.id DESC
+        LIMIT %s OFFSET %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, user_id, limit, offset])
+        return cursor.fetchall()
+
+
+def _search_fallback(user_id, query, limit, offset):
+    entries = JournalEntry.objects.filter(
+        user_id=user_id, content_text__icontains=query
+    ).order_by('-created_at', '-id').values_list('id', 'created_at', 'content_text')[offset:offset + limit]
+    return [(entry_id, created_at, 0, text[:200]) for entry_id, created_at, text in entries]
+
+
+def search_journal(user, query, limit=20, offset=0):
+    """
+    Return up to `limit` of the user's entries matching `query`, best match
+    first, as dicts with id, created_at, rank and an HTML-safe headline.
+    """
+    search = {
+        'postgresql': _search_postgresql,
+        'sqlite': _search_sqlite,
+    }.get(connection.vendor, _search_fallback)
+    return [
+        {
+            'id': entry_id,
+            'created_at': created_at,
+            'rank': rank,
+            'headline': _highlight(headline),
+        }
+        for entry_id, created_at, rank, headline in search(user.id, query, limit, offset)
+    ]
@@ -1,18 +1,60 @@
-from rest_framework import serializers
-from .models import YearlyGoal, QuarterlyGoal, KPI, KPIRecord, UserProfile, Vision, RICHItem, JournalEntry
+from rest_framework import serializers, permissions
+from .models import YearlyGoal, QuarterlyGoal, KPI, KPIRecord, KPIRollup, UserProfile, Vision, RICHItem, JournalEntry
 from djoser.serializers import UserCreateSerializer
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
 from datetime import date
 
 User = get_user_model()
 
+class DynamicFieldsMixin:
+    """
+    Lets read requests prune a serializer with `?fields=id,name` and opt in to
+    the costly fields listed in Meta.expandable_fields with `?expand=a,b`.
+    Without either parameter every field is returned.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.get_requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @staticmethod
+    def _split(value):
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        """Return the field names a read request asks for, or None for all of them"""
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return None
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+
+        names = set(cls.Meta.fields)
+        if params.get('fields'):
+            names &= cls._split(params['fields'])
+        if 'expand' in params:
+            expandable = set(getattr(cls.Meta, 'expandable_fields', []))
+            names -= expandable - cls._split(params['expand'])
+        return names
+
+    @classmethod
+    def wants_field(cls, request, name):
+        """Views use this to skip prefetches for fields that won't be rendered"""
+        requested = cls.get_requested_fields(request)
+        return requested is None or name in requested
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['id', 'user', 'role', 'phone']
         read_only_fields = ['user']
 
-class KPIRecordSerializer(serializers.ModelSerializer):
+class KPIRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = KPIRecord
         fields = ['id', 'kpi', 'entry_date', 'value', 'notes', 'created_at']
@@ -56,7 +98,32 @@ class KPIRecordSerializer(serializers.ModelSerializer):
             # Create new record
             return super().create(validated_data)
 
-class KPISerializer(serializers.ModelSerializer):
+class KPIRecordBulkItemSerializer(serializers.Serializer):
+    """
+    One item of a bulk KPI record upsert. KPI ownership is checked by the view
+    for the whole batch at once, so `kpi` is a plain id here.
+    """
+    kpi = serializers.IntegerField()
+    entry_date = serializers.DateField()
+    value = serializers.FloatField()
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+class KPIRollupSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = KPIRollup
+        fields = ['granularity', 'period_start', 'sum_value', 'min_value',
+                 'max_value', 'count', 'last_value', 'last_entry_date']
+
+class KPIListSerializer(serializers.ListSerializer):
+    """Loads every listed KPI's recent records with one windowed query"""
+
+    def to_representation(self, data):
+        kpis = list(data.all() if hasattr(data, 'all') else data)
+        if 'recent_records' in self.child.fields or 'progress' in self.child.fields:
+            self.child.context['recent_records'] = KPIRecord.recent_for_kpis(kpi.id for kpi in kpis)
+        return super().to_representation(kpis)
+
+class KPISerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     recent_records = serializers.SerializerMethodField()
     progress = serializers.SerializerMethodField()
 
@@ -64,6 +131,8 @@ class KPISerializer(serializers.ModelSerializer):
         model = KPI
         fields = ['id', 'quarterly_goal', 'name', 'frequency',
                  'target_value', 'unit', 'recent_records', 'progress']
+        expandable_fields = ['recent_records', 'progress']
+        list_serializer_class = KPIListSerializer
         read_only_fields = ['user']
         extra_kwargs = {
             'name': {'required': True},
@@ -72,18 +141,24 @@ class KPISerializer(serializers.ModelSerializer):
             'unit': {'required': True},
         }
 
+    def _recent_records(self, obj):
+        # KPIListSerializer pre-fetches every KPI's recent records in one query
+        recent = self.context.get('recent_records')
+        if recent is not None and obj.id in recent:
+            return recent[obj.id]
+        return list(obj.get_recent_records())
+
     def get_recent_records(self, obj):
-        records = obj.get_recent_records()
-        return KPIRecordSerializer(records, many=True).data
+        return KPIRecordSerializer(self._recent_records(obj), many=True).data
 
     def get_progress(self, obj):
-        return obj.get_progress()
+        return obj.get_progress(records=self._recent_records(obj))
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class YearlyGoalSerializer(serializers.ModelSerializer):
+class YearlyGoalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = YearlyGoal
         fields = ['id', 'user', 'description', 'life_sector', 
@@ -94,7 +169,7 @@ class YearlyGoalSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class QuarterlyGoalSerializer(serializers.ModelSerializer):
+class QuarterlyGoalSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     progress = serializers.SerializerMethodField()
     yearly_goal = YearlyGoalSerializer(read_only=True)
 
@@ -102,6 +177,7 @@ class QuarterlyGoalSerializer(serializers.ModelSerializer):
         model = QuarterlyGoal
         fields = ['id', 'yearly_goal', 'life_sector', 'description', 
                  'quarter', 'start_date', 'end_date', 'progress']
+        expandable_fields = ['yearly_goal', 'progress']
 
     def get_progress(self, obj):
         return obj.get_progress()
@@ -110,23 +186,30 @@ class QuarterlyGoalSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
-class VisionSerializer(serializers.ModelSerializer):
+class VisionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Vision
         fields = ['id', 'title', 'description', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
-class RICHItemSerializer(serializers.ModelSerializer):
+class RICHItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = RICHItem
         fields = ['id', 'title', 'description', 'rich_type', 'created_at', 'retired']
         read_only_fields = ['created_at']
 
-class JournalEntrySerializer(serializers.ModelSerializer):
+class JournalEntrySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = JournalEntry
-        fields = ['id', 'content_html', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'content_html', 'excerpt', 'word_count', 'created_at', 'updated_at']
+        read_only_fields = ['excerpt', 'word_count', 'created_at', 'updated_at']
+
+class JournalEntryListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Preview representation for journal lists; the body is only sent on retrieve"""
+    class Meta:
+        model = JournalEntry
+        fields = ['id', 'excerpt', 'word_count', 'created_at', 'updated_at']
+        read_only_fields = fields
 
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta(UserCreateSerializer.Meta):
@@ -142,4 +225,14 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         print("Creating user with data:", validated_data)  # Add this for debugging
         user = User.objects.create_user(**validated_data)
         # Add any additional setup for new users here
-        return user 
\ No newline at end of file
+        return user 
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds the user's role to the token so clients and views can read it without a profile query"""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        profile = getattr(user, 'profile', None)
+        token['role'] = profile.role if profile else None
+        return token
@@ -0,0 +1,47 @@
+"""
+Downsampling helpers for chart-oriented KPI endpoints.
+"""
+
+
+def lttb(points, threshold):
+    """
+    Downsample `points`, a list of (x, y) pairs sorted by x, to at most
+    `threshold` points using Largest-Triangle-Three-Buckets. The first and
+    last points are always kept, and the visual shape of the series is
+    preserved much better than by plain striding. Runs in O(n).
+    """
+    n = len(points)
+    if threshold >= n:
+        return list(points)
+    if threshold < 3:
+        return [points[0], points[-1]][:max(threshold, 0)]
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # index of the previously selected point
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_len = next_end - next_start
+        avg_x = sum(points[j][0] for j in range(next_start, next_end)) / next_len
+        avg_y = sum(points[j][1] for j in range(next_start, next_end)) / next_len
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = points[a]
+        max_area = -1
+        chosen = start
+        for j in range(start, end):
+            x, y = points[j]
+            area = abs((ax - avg_x) * (y - ay) - (ax - x) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                chosen = j
+
+        sampled.append(points[chosen])
+        a = chosen
+
+    sampled.append(points[-1])
+    return sampled
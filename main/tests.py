@@ -2,10 +2,25 @@ from django.test import TestCase
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Vision, RICHItem, YearlyGoal, QuarterlyGoal, KPI, JournalEntry
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.core.cache import cache
+from io import StringIO
+from unittest import mock
+import json
+import hmac
+import hashlib
+from django.conf import settings
+from datetime import date, timedelta
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import (Vision, RICHItem, YearlyGoal, QuarterlyGoal, KPI, KPIRecord, KPIRollup,
+                     JournalEntry, WebhookOutbox, UserProfile)
 
 class PGOSAPITests(TestCase):
     def setUp(self):
+        cache.clear()
         # Create test user
         self.user = User.objects.create_user(
             username='testuser',
@@ -53,6 +68,407 @@ class PGOSAPITests(TestCase):
         self.assertIn('stats', response.data)
         self.assertIn('recent_activity', response.data)
 
+    def test_kpi_list_recent_records(self):
+        # Create KPIs with more records than the recent window
+        for i in range(3):
+            kpi = KPI.objects.create(user=self.user, name=f'KPI {i}', target_value=10)
+            for day in range(10):
+                KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, 1) + timedelta(days=day), value=day)
+
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get('/api/kpis/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for kpi in response.data:
+            self.assertEqual(len(kpi['recent_records']), 7)
+            self.assertEqual(kpi['recent_records'][0]['entry_date'], '2025-01-10')
+            self.assertEqual(kpi['progress']['current_value'], 9)
+            self.assertEqual(kpi['progress']['percentage'], 90)
+
+        # Query count must not grow with the number of KPIs
+        for i in range(3, 10):
+            kpi = KPI.objects.create(user=self.user, name=f'KPI {i}', target_value=10)
+            KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, 1), value=1)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get('/api/kpis/')
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(len(few), len(many))
+
+    def test_kpi_record_bulk_upsert(self):
+        kpi = KPI.objects.create(user=self.user, name='Steps', target_value=10000)
+        other_user = User.objects.create_user(username='other', password='otherpass123')
+        other_kpi = KPI.objects.create(user=other_user, name='Other', target_value=1)
+        KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, 1), value=100)
+
+        response = self.client.post('/api/kpi-records/bulk/', [
+            {'kpi': kpi.id, 'entry_date': '2025-01-01', 'value': 5000},
+            {'kpi': kpi.id, 'entry_date': '2025-01-02', 'value': 7000, 'notes': 'walk'},
+            {'kpi': other_kpi.id, 'entry_date': '2025-01-02', 'value': 1},
+            {'kpi': kpi.id, 'entry_date': 'not-a-date', 'value': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['saved'], 2)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['saved', 'saved', 'invalid', 'invalid']
+        )
+        self.assertEqual(KPIRecord.objects.get(kpi=kpi, entry_date=date(2025, 1, 1)).value, 5000)
+        self.assertEqual(KPIRecord.objects.filter(kpi=kpi).count(), 2)
+        self.assertFalse(KPIRecord.objects.filter(kpi=other_kpi).exists())
+
+    def test_kpi_rollups(self):
+        kpi = KPI.objects.create(user=self.user, name='Pushups', frequency='weekly', target_value=50)
+        # 2025-01-06 is a Monday
+        for day, value in [(6, 10), (7, 30), (8, 20), (13, 5)]:
+            KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, day), value=value)
+
+        week = KPIRollup.objects.get(kpi=kpi, granularity='weekly', period_start=date(2025, 1, 6))
+        self.assertEqual((week.sum_value, week.min_value, week.max_value, week.count), (60, 10, 30, 3))
+        self.assertEqual((week.last_value, week.last_entry_date), (20, date(2025, 1, 8)))
+
+        # Moving a record to another period refreshes both periods
+        record = KPIRecord.objects.get(kpi=kpi, entry_date=date(2025, 1, 8))
+        record.entry_date = date(2025, 1, 14)
+        record.save()
+        week.refresh_from_db()
+        self.assertEqual((week.sum_value, week.count, week.last_value), (40, 2, 30))
+        self.assertEqual(
+            KPIRollup.objects.get(kpi=kpi, granularity='weekly', period_start=date(2025, 1, 13)).sum_value, 25)
+
+        # Deleting the only record of a day drops that day's rollup
+        KPIRecord.objects.get(kpi=kpi, entry_date=date(2025, 1, 13)).delete()
+        self.assertFalse(KPIRollup.objects.filter(
+            kpi=kpi, granularity='daily', period_start=date(2025, 1, 13)).exists())
+
+        # Bulk upserts keep rollups in sync too
+        self.client.post('/api/kpi-records/bulk/', [
+            {'kpi': kpi.id, 'entry_date': '2025-01-06', 'value': 100},
+        ], format='json')
+        month = KPIRollup.objects.get(kpi=kpi, granularity='monthly', period_start=date(2025, 1, 1))
+        self.assertEqual((month.sum_value, month.max_value, month.count), (150, 100, 3))
+
+        # A rebuild from scratch produces the same rollups
+        snapshot = list(KPIRollup.objects.values_list(
+            'granularity', 'period_start', 'sum_value', 'min_value', 'max_value', 'count', 'last_value'))
+        call_command('rebuild_kpi_rollups', stdout=StringIO())
+        self.assertEqual(snapshot, list(KPIRollup.objects.values_list(
+            'granularity', 'period_start', 'sum_value', 'min_value', 'max_value', 'count', 'last_value')))
+
+        response = self.client.get(f'/api/kpis/{kpi.id}/rollups/', {'start': '2025-01-07'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['period_start'] for row in response.data], ['2025-01-06', '2025-01-13'])
+
+        # Deleting the KPI cascades to its rollups
+        kpi.delete()
+        self.assertFalse(KPIRollup.objects.exists())
+
+    def test_kpi_series_downsampling(self):
+        kpi = KPI.objects.create(user=self.user, name='Weight', target_value=80)
+        KPIRecord.objects.bulk_create([
+            KPIRecord(kpi=kpi, entry_date=date(2024, 1, 1) + timedelta(days=day), value=day % 17)
+            for day in range(400)
+        ])
+
+        response = self.client.get(f'/api/kpis/{kpi.id}/series/', {'max_points': 50})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_points'], 400)
+        points = response.data['points']
+        self.assertEqual(len(points), 50)
+        self.assertEqual(points[0]['date'], date(2024, 1, 1))
+        self.assertEqual(points[-1]['date'], date(2024, 1, 1) + timedelta(days=399))
+
+        response = self.client.get(f'/api/kpis/{kpi.id}/series/', {'start': '2024-01-01', 'end': '2024-01-10'})
+        self.assertEqual(len(response.data['points']), 10)
+
+    def test_quarterly_goal_list_progress(self):
+        yearly = YearlyGoal.objects.create(
+            user=self.user, description='Fit', start_date=date(2025, 1, 1), end_date=date(2025, 12, 31))
+        for i in range(5):
+            goal = QuarterlyGoal.objects.create(
+                user=self.user, yearly_goal=yearly, description=f'Goal {i}', quarter=1,
+                start_date=date(2025, 1, 1), end_date=date(2025, 3, 31))
+            done = KPI.objects.create(user=self.user, quarterly_goal=goal, name='Done', target_value=5)
+            KPIRecord.objects.create(kpi=done, entry_date=date(2025, 1, 1), value=3)
+            KPIRecord.objects.create(kpi=done, entry_date=date(2025, 2, 1), value=6)
+            KPI.objects.create(user=self.user, quarterly_goal=goal, name='Pending', target_value=5)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/quarterly-goals/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        for goal in response.data['results']:
+            self.assertEqual(goal['progress'], {'total_kpis': 2, 'completed_kpis': 1})
+            self.assertEqual(goal['yearly_goal']['id'], yearly.id)
+        # Authentication, the ETag version lookup and a single list query
+        self.assertLessEqual(len(queries), 3)
+
+        goal = QuarterlyGoal.objects.first()
+        self.assertEqual(goal.get_progress(), {'total_kpis': 2, 'completed_kpis': 1})
+
+    def test_dashboard_cache_invalidation(self):
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['stats']['kpisTracked'], 0)
+
+        # Warm opens are served from the cache: authentication and the version lookup only
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/dashboard/')
+        self.assertLessEqual(len(queries), 2)
+
+        kpi = KPI.objects.create(user=self.user, name='Read', target_value=20, unit='pages')
+        KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, 1), value=12)
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['stats']['kpisTracked'], 1)
+        self.assertEqual(response.data['recent_activity'][0]['description'], 'Tracked KPI Read: 12.0 pages')
+
+        RICHItem.objects.create(user=self.user, title='Chess', rich_type='hobby')
+        response = self.client.get('/api/dashboard/')
+        self.assertEqual(response.data['stats']['richItems'], 1)
+
+    def test_kpi_record_export(self):
+        kpi = KPI.objects.create(user=self.user, name='Water', target_value=8, unit='glasses')
+        for day in range(3):
+            KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 1, 1 + day), value=day)
+
+        response = self.client.get('/api/kpi-records/export/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'kpi_id,kpi,unit,entry_date,value,notes,created_at')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f'{kpi.id},Water,glasses,2025-01-01,0.0'))
+
+        response = self.client.get('/api/kpi-records/export/', {'output': 'ndjson', 'kpi': kpi.id})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['value'] for row in rows], [0, 1, 2])
+
+    def test_journal_cursor_pagination(self):
+        JournalEntry.objects.bulk_create([
+            JournalEntry(user=self.user, content_html=f'<p>Entry {i}</p>') for i in range(7)
+        ])
+        seen = []
+        url = '/api/journal/?limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(entry['id'] for entry in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, list(JournalEntry.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_kpi_record_keyset_pagination(self):
+        kpis = [KPI.objects.create(user=self.user, name=f'KPI {i}', target_value=1) for i in range(3)]
+        # Several records per date, so the cursor can't position on entry_date alone
+        KPIRecord.objects.bulk_create([
+            KPIRecord(kpi=kpi, entry_date=date(2025, 1, 1) + timedelta(days=day), value=day)
+            for kpi in kpis for day in range(3)
+        ])
+        expected = list(KPIRecord.objects.order_by('-entry_date', '-id').values_list('id', flat=True))
+
+        seen = []
+        url = '/api/kpi-records/?limit=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+            seen.extend(record['id'] for record in response.data['results'])
+            previous, url = response.data['previous'], response.data['next']
+        self.assertEqual(seen, expected)
+
+        # Paging backwards from the last page visits the same rows
+        seen = []
+        url = previous
+        while url:
+            response = self.client.get(url)
+            seen[:0] = [record['id'] for record in response.data['results']]
+            url = response.data['previous']
+        self.assertEqual(seen, expected[:len(seen)])
+        self.assertEqual(len(seen), len(expected) - 1)
+
+    def test_goal_history_pagination(self):
+        response = self.client.post('/api/yearly-goals/', {
+            'description': 'v0', 'life_sector': 'health',
+            'start_date': '2025-01-01', 'end_date': '2025-12-31'
+        })
+        goal_id = response.data['id']
+        for i in range(1, 5):
+            self.client.patch(f'/api/yearly-goals/{goal_id}/', {'description': f'v{i}'})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/yearly-goals/{goal_id}/history/', {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = response.data['results']
+        self.assertEqual(len(page), 2)
+        self.assertEqual(page[0]['changes'], {'description': {'from': 'v3', 'to': 'v4'}})
+        # The oldest row of the page is diffed against the first row of the next page
+        self.assertEqual(page[1]['changes'], {'description': {'from': 'v2', 'to': 'v3'}})
+        # Auth, goal lookup, page and preceding record
+        self.assertLessEqual(len(queries), 4)
+
+        response = self.client.get(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'][-1]['changes'], {})
+        self.assertIsNone(response.data['next'])
+
+    def test_journal_search(self):
+        JournalEntry.objects.create(user=self.user, content_html='<p>Went running in the park &amp; felt great</p>')
+        JournalEntry.objects.create(user=self.user, content_html='<p>Quiet day reading</p><p>park bench</p>')
+        JournalEntry.objects.create(user=self.user, content_html='<p>Nothing to see &lt;script&gt;</p>')
+        other_user = User.objects.create_user(username='other', password='otherpass123')
+        JournalEntry.objects.create(user=other_user, content_html='<p>park</p>')
+
+        entry = JournalEntry.objects.get(content_html__contains='running')
+        self.assertEqual(entry.content_text, 'Went running in the park & felt great')
+
+        response = self.client.get('/api/journal/search/', {'q': 'park'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIn('<mark>park</mark>', response.data['results'][0]['headline'])
+
+        response = self.client.get('/api/journal/search/', {'q': 'script'})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotIn('<script>', response.data['results'][0]['headline'])
+
+        # Edits and deletes keep the index current
+        entry.content_html = '<p>Swimming laps</p>'
+        entry.save()
+        response = self.client.get('/api/journal/search/', {'q': 'park', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next_offset'])
+        entry.delete()
+        response = self.client.get('/api/journal/search/', {'q': 'swimming'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_journal_webhook_outbox(self):
+        self.client.credentials()
+        body = json.dumps({'content_html': '<p>Voice note</p>'})
+        signature = hmac.new(settings.ELEVENLABS_WEBHOOK_SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+        response = self.client.post('/api/webhooks/journal/', body, content_type='application/json',
+                                    HTTP_X_WEBHOOK_SIGNATURE=signature)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post('/api/webhooks/journal/', body, content_type='application/json',
+                                    HTTP_X_WEBHOOK_SIGNATURE='bad')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.post('/api/webhooks/journal/', 'not json', content_type='application/json')
+        self.assertFalse(JournalEntry.objects.exists())
+
+        with mock.patch('main.outbox.WEBHOOK_USER_ID', self.user.id):
+            call_command('process_journal_outbox', stdout=StringIO())
+        entry = JournalEntry.objects.get()
+        self.assertEqual((entry.user_id, entry.content_text), (self.user.id, 'Voice note'))
+        self.assertEqual(
+            sorted(WebhookOutbox.objects.values_list('status', flat=True)), ['dead', 'done'])
+
+    def test_journal_list_excerpts(self):
+        words = ' '.join(f'word{i}' for i in range(100))
+        response = self.client.post('/api/journal/', {'content_html': f'<p>{words}</p>'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['word_count'], 100)
+
+        response = self.client.get('/api/journal/')
+        entry = response.data['results'][0]
+        self.assertNotIn('content_html', entry)
+        self.assertEqual(entry['word_count'], 100)
+        self.assertLessEqual(len(entry['excerpt']), 200)
+        self.assertTrue(entry['excerpt'].startswith('word0 word1'))
+        self.assertTrue(entry['excerpt'].endswith('…'))
+
+        response = self.client.get(f"/api/journal/{entry['id']}/")
+        self.assertEqual(response.data['content_html'], f'<p>{words}</p>')
+
+    def test_sparse_fields_and_expand(self):
+        goal = QuarterlyGoal.objects.create(
+            user=self.user, description='Read more', quarter=2,
+            start_date=date(2025, 4, 1), end_date=date(2025, 6, 30))
+        kpi = KPI.objects.create(user=self.user, quarterly_goal=goal, name='Books', target_value=3)
+        KPIRecord.objects.create(kpi=kpi, entry_date=date(2025, 4, 2), value=1)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/kpis/', {'fields': 'id,name'})
+        self.assertEqual(response.data, [{'id': kpi.id, 'name': 'Books'}])
+        # Authentication, the ETag version lookup and the KPI query, no recent records query
+        self.assertEqual(len(queries), 3)
+
+        response = self.client.get('/api/kpis/', {'expand': 'progress'})
+        self.assertIn('progress', response.data[0])
+        self.assertNotIn('recent_records', response.data[0])
+        self.assertIn('unit', response.data[0])
+
+        response = self.client.get('/api/quarterly-goals/', {'expand': ''})
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'life_sector', 'description', 'quarter', 'start_date', 'end_date'})
+
+        # Writes always use the full serializer
+        response = self.client.post('/api/kpis/?fields=id', {
+            'name': 'Pages', 'frequency': 'daily', 'target_value': 20, 'unit': 'pages'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('progress', response.data)
+
+    def test_conditional_get(self):
+        RICHItem.objects.create(user=self.user, title='Family', rich_type='responsibility')
+        response = self.client.get('/api/rich/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        # Second-resolution dates could hide a write made in the same second
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get('/api/rich/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/rich/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Only authentication and the version lookup touch the database
+        self.assertEqual(len(queries), 2)
+
+        # The version lives in the database, not in this process' cache
+        cache.clear()
+        response = self.client.get('/api/rich/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # Other query strings get their own ETag
+        response = self.client.get('/api/rich/?fields=id', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        RICHItem.objects.create(user=self.user, title='Guitar', rich_type='hobby')
+        response = self.client.get('/api/rich/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+
+    def test_authentication_hot_path(self):
+        self.assertEqual(AccessToken(self.token)['role'], self.user.profile.role)
+
+        # The user and its profile come from a single query
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 1)
+
+        # Saving the user without touching the profile doesn't write it
+        user = User.objects.select_related('profile').get(id=self.user.id)
+        with CaptureQueriesContext(connection) as queries:
+            user.save(update_fields=['last_login'])
+        self.assertFalse(any('user_profile' in query['sql'] for query in queries))
+
+        user.profile.phone = '555-0100'
+        user.save()
+        self.assertEqual(UserProfile.objects.get(user=user).phone, '555-0100')
+
+        # simplejwt's own checks still apply
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+            self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_200_OK)
+            user.set_password('changed-pass-456')
+            user.save()
+            response = self.client.get('/api/users/profile/')
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Deactivation takes effect at once, even when written without signals
+        # (as by another process)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        self.assertEqual(self.client.get('/api/users/profile/').status_code, status.HTTP_200_OK)
+        User.objects.filter(id=user.id).update(is_active=False)
+        response = self.client.get('/api/users/profile/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
     def test_unauthorized_access(self):
         # Remove credentials
         self.client.credentials()
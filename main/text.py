@@ -0,0 +1,30 @@
+"""
+Plain-text helpers for rich-text (HTML) journal content.
+"""
+import html
+import re
+
+_TAG_RE = re.compile(r'<[^>]*>')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+EXCERPT_LENGTH = 200
+
+
+def html_to_text(content_html):
+    """Strip tags and entities from HTML, keeping words separated"""
+    if not content_html:
+        return ''
+    text = html.unescape(_TAG_RE.sub(' ', content_html))
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """Shorten plain text to at most `length` characters on a word boundary"""
+    if len(text) <= length:
+        return text
+    cut = text[:length - 1].rsplit(' ', 1)[0] or text[:length - 1]
+    return cut.rstrip() + '…'
+
+
+def word_count(text):
+    return len(text.split())
@@ -1,25 +1,39 @@
 # main/views.py
 from django.utils.timezone import localtime, now, timedelta, make_aware
-from .models import QuarterlyGoal, Vision, RICHItem, JournalEntry
+from .models import QuarterlyGoal, Vision, RICHItem, JournalEntry, WebhookOutbox
 
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action, api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import YearlyGoal, KPI, KPIRecord, UserProfile
+from .models import YearlyGoal, KPI, KPIRecord, KPIRollup, UserProfile
 from .serializers import (YearlyGoalSerializer, QuarterlyGoalSerializer,
-                         KPISerializer, KPIRecordSerializer, UserProfileSerializer,
-                         VisionSerializer, RICHItemSerializer, JournalEntrySerializer)
-from django.db.models import Count
+                         KPISerializer, KPIRecordSerializer, KPIRecordBulkItemSerializer,
+                         KPIRollupSerializer,
+                         UserProfileSerializer,
+                         VisionSerializer, RICHItemSerializer, JournalEntrySerializer,
+                         JournalEntryListSerializer)
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.core.cache import cache
 from django.utils import timezone
 from django.contrib.auth.models import User
 import logging
 from rest_framework.permissions import AllowAny
 from django.conf import settings
+from datetime import date
+from .series import lttb
+from .search import search_journal
+from .pagination import CreatedAtCursorPagination, EntryDateCursorPagination, HistoryCursorPagination
+from .cache import (DASHBOARD_CACHE_TIMEOUT, bump_user_version, dashboard_cache_key,
+                    get_user_version)
+from django.utils.cache import get_conditional_response, patch_vary_headers
 import hmac
 import hashlib
 import json
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+import csv
 
 logger = logging.getLogger(__name__)
 
@@ -41,24 +55,61 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_403_FORBIDDEN)
         return super().retrieve(request, pk)
 
-class YearlyGoalViewSet(viewsets.ModelViewSet):
-    serializer_class = YearlyGoalSerializer
-    permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['title', 'description']
-    filterset_fields = ['start_date', 'end_date']
-
-    def get_queryset(self):
-        return YearlyGoal.objects.filter(user=self.request.user)
+class ConditionalGetMixin:
+    """
+    ETag support for list and retrieve, derived from the user's change
+    counter (see cache.py). Unchanged data gets a 304 after a single
+    primary-key lookup, before any serialization runs. No Last-Modified is
+    sent: its one-second resolution would hide a write made in the same
+    second as the client's previous GET.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+    def _conditional(self, request, view, *args, **kwargs):
+        version = get_user_version(request.user.id)
+        fingerprint = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        etag = f'"{version}-{fingerprint}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+class HistoryMixin:
+    """
+    Adds a paginated `history` action for models tracked by django-simple-history.
+    Each page is diffed in memory: one query for the page (with history_user
+    joined) and one for the record preceding its oldest row.
+    """
 
     @action(detail=True, methods=['get'])
     def history(self, request, pk=None):
         goal = self.get_object()
+        records = goal.history.select_related('history_user')
+        paginator = HistoryCursorPagination()
+        page = paginator.paginate_queryset(records, request, view=self)
+
+        older = None
+        if page:
+            oldest = page[-1]
+            older = records.filter(
+                Q(history_date__lt=oldest.history_date) |
+                Q(history_date=oldest.history_date, history_id__lt=oldest.history_id)
+            ).order_by('-history_date', '-history_id').first()
+
         history = []
-        for record in goal.history.all():
+        for record, prev_record in zip(page, page[1:] + [older]):
             changes = {}
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
+            if prev_record:
+                delta = record.diff_against(prev_record)
                 changes = {
                     change.field: {
                         'from': change.old,
@@ -66,48 +117,46 @@ class YearlyGoalViewSet(viewsets.ModelViewSet):
                     }
                     for change in delta.changes
                 }
-            
+
             history.append({
                 'user': record.history_user.username if record.history_user else 'System',
                 'created_at': record.history_date,
                 'changes': changes
             })
-        return Response(history)
+        return paginator.get_paginated_response(history)
+
+class YearlyGoalViewSet(ConditionalGetMixin, HistoryMixin, viewsets.ModelViewSet):
+    serializer_class = YearlyGoalSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    search_fields = ['title', 'description']
+    filterset_fields = ['start_date', 'end_date']
 
-class QuarterlyGoalViewSet(viewsets.ModelViewSet):
+    def get_queryset(self):
+        return YearlyGoal.objects.filter(user=self.request.user)
+
+class QuarterlyGoalViewSet(ConditionalGetMixin, HistoryMixin, viewsets.ModelViewSet):
     serializer_class = QuarterlyGoalSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     search_fields = ['life_sector', 'description']
     filterset_fields = ['quarter', 'yearly_goal']
 
     def get_queryset(self):
-        return QuarterlyGoal.objects.filter(user=self.request.user)
+        queryset = QuarterlyGoal.objects.filter(user=self.request.user)
+        serializer_class = self.get_serializer_class()
+        if serializer_class.wants_field(self.request, 'yearly_goal'):
+            queryset = queryset.select_related('yearly_goal')
+        if serializer_class.wants_field(self.request, 'progress'):
+            queryset = queryset.with_progress()
+        return queryset
 
-    @action(detail=True, methods=['get'])
-    def history(self, request, pk=None):
-        goal = self.get_object()
-        history = []
-        for record in goal.history.all():
-            changes = {}
-            if record.prev_record:
-                delta = record.diff_against(record.prev_record)
-                changes = {
-                    change.field: {
-                        'from': change.old,
-                        'to': change.new
-                    }
-                    for change in delta.changes
-                }
-            
-            history.append({
-                'user': record.history_user.username if record.history_user else 'System',
-                'created_at': record.history_date,
-                'changes': changes
-            })
-        return Response(history)
+class KPIViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    SERIES_DEFAULT_POINTS = 500
+    SERIES_MAX_POINTS = 5000
 
-class KPIViewSet(viewsets.ModelViewSet):
     serializer_class = KPISerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
@@ -115,10 +164,7 @@ class KPIViewSet(viewsets.ModelViewSet):
     filterset_fields = ['frequency', 'quarterly_goal']
 
     def get_queryset(self):
-        print(f"Fetching KPIs for user {self.request.user.username}")  # Add debug print
-        queryset = KPI.objects.filter(user=self.request.user)
-        print(f"Found {queryset.count()} KPIs")  # Add debug print
-        return queryset
+        return KPI.objects.filter(user=self.request.user)
 
     @action(detail=True, methods=['get'])
     def progress(self, request, pk=None):
@@ -129,9 +175,75 @@ class KPIViewSet(viewsets.ModelViewSet):
                 kpi.get_recent_records(), many=True).data
         })
 
-class KPIRecordViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def rollups(self, request, pk=None):
+        """
+        Aggregates per period from the rollup table.
+        Query params: granularity (daily/weekly/monthly, defaults to the KPI's
+        frequency), start and end dates (inclusive, optional).
+        """
+        kpi = self.get_object()
+        granularity = request.query_params.get('granularity', kpi.frequency)
+        if granularity not in KPIRollup.GRANULARITIES:
+            return Response(
+                {"error": f"granularity must be one of {', '.join(KPIRollup.GRANULARITIES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rollups = kpi.rollups.filter(granularity=granularity)
+        try:
+            if request.query_params.get('start'):
+                start = date.fromisoformat(request.query_params['start'])
+                rollups = rollups.filter(period_start__gte=KPIRollup.period_bounds(granularity, start)[0])
+            if request.query_params.get('end'):
+                rollups = rollups.filter(period_start__lte=date.fromisoformat(request.query_params['end']))
+        except ValueError:
+            return Response(
+                {"error": "start and end must be YYYY-MM-DD dates"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(KPIRollupSerializer(rollups, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def series(self, request, pk=None):
+        """
+        Chart-ready time series of a KPI, downsampled server-side with LTTB.
+        Query params: start and end dates (inclusive, optional) and
+        max_points (default 500, capped at 5000).
+        """
+        kpi = self.get_object()
+        records = kpi.records.order_by('entry_date')
+        try:
+            if request.query_params.get('start'):
+                records = records.filter(entry_date__gte=date.fromisoformat(request.query_params['start']))
+            if request.query_params.get('end'):
+                records = records.filter(entry_date__lte=date.fromisoformat(request.query_params['end']))
+            max_points = int(request.query_params.get('max_points', self.SERIES_DEFAULT_POINTS))
+        except ValueError:
+            return Response(
+                {"error": "start/end must be YYYY-MM-DD dates and max_points an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_points = min(max(max_points, 3), self.SERIES_MAX_POINTS)
+
+        points = [(day.toordinal(), value) for day, value in records.values_list('entry_date', 'value')]
+        sampled = lttb(points, max_points)
+        return Response({
+            'kpi': kpi.id,
+            'total_points': len(points),
+            'points': [
+                {'date': date.fromordinal(x), 'value': y}
+                for x, y in sampled
+            ],
+        })
+
+class KPIRecordViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    EXPORT_CHUNK_SIZE = 2000
+    EXPORT_FIELDS = ['kpi_id', 'kpi', 'unit', 'entry_date', 'value', 'notes', 'created_at']
+
     serializer_class = KPIRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EntryDateCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['entry_date', 'kpi']
 
@@ -168,39 +280,185 @@ class KPIRecordViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save()
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Upsert many KPI records at once, keyed on (kpi, entry_date).
+        Accepts a list of records (or {"records": [...]}) and returns one
+        result per item, in request order.
+        """
+        items = request.data.get('records') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of records"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = KPIRecordBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+
+        # Validate ownership for every KPI in the batch with one query
+        owned = set(KPI.objects.filter(
+            user=request.user,
+            id__in={data['kpi'] for _, data in valid}
+        ).values_list('id', flat=True))
+
+        # Later items win when the same (kpi, entry_date) appears twice
+        pending = {}
+        for index, data in valid:
+            if data['kpi'] not in owned:
+                results[index] = {
+                    'index': index,
+                    'status': 'invalid',
+                    'errors': {'kpi': ['KPI not found or does not belong to user']}
+                }
+                continue
+            key = (data['kpi'], data['entry_date'])
+            if key in pending:
+                results[pending[key][0]] = {'index': pending[key][0], 'status': 'superseded'}
+            pending[key] = (index, data)
+
+        records = [
+            KPIRecord(
+                kpi_id=data['kpi'],
+                entry_date=data['entry_date'],
+                value=data['value'],
+                notes=data['notes']
+            )
+            for index, data in pending.values()
+        ]
+        if records:
+            with transaction.atomic():
+                KPIRecord.objects.bulk_create(
+                    records,
+                    update_conflicts=True,
+                    unique_fields=['kpi', 'entry_date'],
+                    update_fields=['value', 'notes'],
+                )
+                # bulk_create skips the post_save signals that keep rollups current
+                KPIRollup.refresh((record.kpi_id, record.entry_date) for record in records)
+            bump_user_version(request.user.id)
+
+        for (index, data), record in zip(pending.values(), records):
+            results[index] = {
+                'index': index,
+                'status': 'saved',
+                'id': record.pk,
+                'kpi': data['kpi'],
+                'entry_date': data['entry_date'],
+            }
+
+        return Response({
+            'saved': len(records),
+            'failed': sum(1 for result in results if result['status'] == 'invalid'),
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the user's full KPI history as CSV (default) or NDJSON.
+        Query params: output (csv/ndjson), kpi (optional filter).
+        Rows are read in chunks so memory stays flat for any history size.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in ('csv', 'ndjson'):
+            return Response(
+                {"error": "output must be csv or ndjson"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        records = self.filter_queryset(self.get_queryset()).select_related('kpi').order_by(
+            'kpi_id', 'entry_date')
+        rows = (
+            {
+                'kpi_id': record.kpi_id,
+                'kpi': record.kpi.name,
+                'unit': record.kpi.unit,
+                'entry_date': record.entry_date.isoformat(),
+                'value': record.value,
+                'notes': record.notes,
+                'created_at': record.created_at.isoformat(),
+            }
+            for record in records.iterator(chunk_size=self.EXPORT_CHUNK_SIZE)
+        )
+
+        if output == 'ndjson':
+            content = (json.dumps(row) + '\n' for row in rows)
+            content_type = 'application/x-ndjson'
+        else:
+            content = self._csv_lines(rows)
+            content_type = 'text/csv'
+
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="kpi-records.{output}"'
+        return response
+
+    @staticmethod
+    def _csv_lines(rows):
+        class Echo:
+            def write(self, value):
+                return value
+
+        writer = csv.DictWriter(Echo(), fieldnames=KPIRecordViewSet.EXPORT_FIELDS)
+        yield writer.writeheader()
+        for row in rows:
+            yield writer.writerow(row)
+
 class DashboardViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def list(self, request):
         user = request.user
+        cache_key = dashboard_cache_key(user.id)
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = self.build_payload(user)
+            cache.set(cache_key, payload, DASHBOARD_CACHE_TIMEOUT)
+        return Response(payload)
+
+    @staticmethod
+    def build_payload(user):
         now = timezone.now()
         last_month = now - timedelta(days=30)
 
-        stats = {
-            'activeGoals': QuarterlyGoal.objects.filter(user=user, end_date__gte=now).count(),
-            'kpisTracked': KPI.objects.filter(user=user).count(),
-            'journalEntries': JournalEntry.objects.filter(user=user).count(),
-            'richItems': RICHItem.objects.filter(user=user, retired=False).count(),
-        }
+        def count(queryset):
+            return Coalesce(Subquery(
+                queryset.order_by().values('user').annotate(n=Count('id')).values('n')
+            ), 0)
+
+        # All four counters in one query
+        stats = User.objects.filter(id=user.id).annotate(
+            activeGoals=count(QuarterlyGoal.objects.filter(user=OuterRef('pk'), end_date__gte=now.date())),
+            kpisTracked=count(KPI.objects.filter(user=OuterRef('pk'))),
+            journalEntries=count(JournalEntry.objects.filter(user=OuterRef('pk'))),
+            richItems=count(RICHItem.objects.filter(user=OuterRef('pk'), retired=False)),
+        ).values('activeGoals', 'kpisTracked', 'journalEntries', 'richItems').get()
 
         recent_activity = []
         # Add recent KPI records
         for record in KPIRecord.objects.filter(
-            kpi__user=user, 
+            kpi__user=user,
             created_at__gte=last_month
-        ).order_by('-created_at')[:3]:  # Only get last 3 records
+        ).select_related('kpi').order_by('-created_at')[:3]:  # Only get last 3 records
             recent_activity.append({
                 'id': f'kpi_{record.id}',
                 'date': record.created_at,
                 'description': f'Tracked KPI {record.kpi.name}: {record.value} {record.kpi.unit}'
             })
 
-        return Response({
+        return {
             'stats': stats,
             'recent_activity': recent_activity  # Will only contain last 3 activities
-        })
+        }
 
-class VisionViewSet(viewsets.ModelViewSet):
+class VisionViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = VisionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -210,7 +468,7 @@ class VisionViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class RICHItemViewSet(viewsets.ModelViewSet):
+class RICHItemViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = RICHItemSerializer
     permission_classes = [permissions.IsAuthenticated]
     filterset_fields = ['rich_type', 'retired']
@@ -222,23 +480,52 @@ class RICHItemViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class JournalEntryViewSet(viewsets.ModelViewSet):
+class JournalEntryViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = JournalEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination  # ?limit= sets the page size
+    filter_backends = [DjangoFilterBackend]
     filterset_fields = ['created_at']
-    search_fields = ['title', 'content_html']
 
     def get_queryset(self):
-        queryset = JournalEntry.objects.filter(user=self.request.user).order_by('-created_at')  # Order first
-        limit = self.request.query_params.get('limit', None)
-        if limit is not None:
-            try:
-                limit = int(limit)
-                queryset = queryset[:limit]  # Then slice
-            except ValueError:
-                pass
+        queryset = JournalEntry.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            queryset = queryset.defer('content_html', 'content_text')
         return queryset
 
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return JournalEntryListSerializer
+        return super().get_serializer_class()
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search over the user's entries.
+        Query params: q (required), limit (default 20, max 100), offset.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"error": "q is required"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+        except ValueError:
+            return Response(
+                {"error": "limit and offset must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Fetch one extra row to know whether another page exists
+        results = search_journal(request.user, query, limit=limit + 1, offset=offset)
+        return Response({
+            'next_offset': offset + limit if len(results) > limit else None,
+            'results': results[:limit],
+        })
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
@@ -246,15 +533,16 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
 @permission_classes([AllowAny])
 @authentication_classes([])
 def journal_webhook(request):
-    """Webhook endpoint for receiving journal entries from ElevenLabs agent."""
-    # Add detailed logging
-    logger.info(f"Received webhook request from: {request.META.get('REMOTE_ADDR')}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    
+    """
+    Webhook endpoint for receiving journal entries from ElevenLabs agent.
+    The payload is only verified and queued here; `process_journal_outbox`
+    creates the entries.
+    """
+    logger.debug(f"Received webhook request from: {request.META.get('REMOTE_ADDR')}")
+
     # Get the raw body for signature verification
     raw_body = request.body.decode('utf-8')
-    logger.info(f"Request body: {raw_body}")
-    
+
     # Verify webhook signature if provided
     signature = request.headers.get('X-Webhook-Signature')
     if signature and hasattr(settings, 'ELEVENLABS_WEBHOOK_SECRET'):
@@ -263,36 +551,16 @@ def journal_webhook(request):
             raw_body.encode(),
             hashlib.sha256
         ).hexdigest()
-        
+
         if not hmac.compare_digest(signature, expected_signature):
             logger.error("Invalid signature")
             return HttpResponse('Invalid signature', status=401)
-    
+
     try:
-        data = json.loads(raw_body)
-        content_html = data.get('content_html')
-        
-        if not content_html:
-            logger.error("Missing content_html in payload")
-            return HttpResponse('Missing required fields', status=400)
-        
-        try:
-            # Use user ID 1 for now (update this based on your needs)
-            user_id = 1
-            entry = JournalEntry.objects.create(
-                user_id=user_id,
-                content_html=content_html
-            )
-            logger.info(f"Created journal entry: {entry.id}")
-            return HttpResponse('Journal entry created', status=201)
-            
-        except Exception as e:
-            logger.error(f"Error creating journal entry: {str(e)}")
-            return HttpResponse('Error creating journal entry', status=500)
-            
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON payload: {str(e)}")
-        return HttpResponse('Invalid JSON payload', status=400)
+        event = WebhookOutbox.objects.create(payload=raw_body)
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        logger.error(f"Error queueing webhook payload: {str(e)}")
         return HttpResponse('Internal server error', status=500)
+
+    logger.info(f"Queued webhook payload {event.id}")
+    return HttpResponse('Journal entry accepted', status=202)
@@ -66,6 +66,7 @@ INSTALLED_APPS = [
 CORS_ALLOWED_ORIGINS = config("CORS_ALLOWED_ORIGINS").split(",")
 
 MIDDLEWARE = [
+    'main.middleware.NonStreamingGZipMiddleware',  # Compress large, non-streamed API responses
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -109,6 +110,34 @@ DATABASES = {
 }
 
 
+# Cache
+# Per-process memory by default; set REDIS_URL (and install `redis`) to share
+# cached dashboards across gunicorn workers. Cached payloads are keyed on the
+# per-user version stored in the database (main.cache), so invalidation holds
+# across processes with either backend.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Seconds an extraction job SSE stream follows the job before closing. Each
+# open stream holds a worker, so keep 0 (replay and close; clients reconnect)
+# with the sync gunicorn workers railway.json starts, and raise it only with
+# `--worker-class gthread` or an async worker.
+SSE_MAX_DURATION = config('SSE_MAX_DURATION', default=0, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -205,7 +234,7 @@ CORS_ALLOW_HEADERS = [
 # Add these settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main.authentication.ProfileJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -219,6 +248,7 @@ SIMPLE_JWT = {
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'main.serializers.RoleTokenObtainPairSerializer',
 }
 
 # Add Djoser settings
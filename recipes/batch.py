@@ -0,0 +1,47 @@
+"""
+Batch recipe imports for RecipeViewSet.batch_import.
+
+Nothing slow runs in the request: URLs the user already saved are reported,
+shared-cache hits are saved straight away and every other URL becomes an
+ExtractionJob run by `run_extraction_jobs`. Clients poll the returned jobs.
+"""
+from .models import ExtractionJob, Recipe
+from .services import ExtractionCache, RecipeExtractionService
+
+MAX_URLS = 50
+
+
+def _save_cached(user, url, data):
+    """Save a shared-cache hit and describe the outcome"""
+    saved = RecipeExtractionService.save_recipe(user, url, data)
+    if 'save_error' in saved:
+        return {'url': url, 'status': 'failed', 'error': saved['save_error']}
+    return {'url': url, 'status': 'imported', 'id': saved['id'], 'title': saved['title'],
+            'source': saved.get('source'), 'cached': True}
+
+
+def queue_many(user, urls):
+    """
+    Import `urls` for `user`, returning one result dict per distinct URL in
+    request order. Costs two lookups, one save per cache hit and a single
+    insert for all queued jobs.
+    """
+    urls = list(dict.fromkeys(urls))
+    existing = dict(Recipe.objects.filter(
+        user=user, source_url__in=urls).values_list('source_url', 'id'))
+    results = {url: {'url': url, 'status': 'exists', 'id': existing[url]}
+               for url in urls if url in existing}
+
+    pending = [url for url in urls if url not in existing]
+    cached = ExtractionCache.get_many_urls(pending)
+    for url, data in cached.items():
+        results[url] = _save_cached(user, url, data)
+
+    jobs = ExtractionJob.objects.bulk_create([
+        ExtractionJob(user=user, url=url, messages=[dict(ExtractionJob.QUEUED_MESSAGE)])
+        for url in pending if url not in cached
+    ])
+    for job in jobs:
+        results[job.url] = {'url': job.url, 'status': 'queued', 'job': job.id}
+
+    return [results[url] for url in urls]
@@ -0,0 +1,87 @@
+"""
+Shared HTTP client for the recipe import pipeline.
+
+One pooled keep-alive session serves every fetch, so repeat requests to the
+same site reuse connections. Each page is downloaded once into a FetchedPage
+that all extraction stages read from.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Common headers to mimic a real browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# (connect, read) seconds
+PAGE_TIMEOUT = (5, 20)
+HEAD_TIMEOUT = (3, 5)
+
+# Hosts kept in the pool and connections per host; callers wait for a free
+# connection instead of opening more than POOL_PER_HOST to one site
+POOL_HOSTS = 32
+POOL_PER_HOST = 4
+
+
+def build_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=POOL_HOSTS,
+        pool_maxsize=POOL_PER_HOST,
+        pool_block=True,
+        max_retries=Retry(total=2, connect=2, read=1, backoff_factor=0.3,
+                          status_forcelist=[502, 503, 504], allowed_methods=['GET', 'HEAD']),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = build_session()
+
+
+class FetchedPage:
+    """A downloaded page; decoded once and reused by every extraction stage"""
+
+    def __init__(self, url, final_url, html):
+        self.url = url
+        self.final_url = final_url
+        self.html = html
+
+
+def decode_html(response):
+    """
+    Body of `response` as text. requests falls back to ISO-8859-1 for text/*
+    without a charset, which mangles UTF-8 pages ("½" becomes "Â½"), so the
+    header charset is only trusted when it is actually sent; otherwise UTF-8
+    is tried before the detected encoding.
+    """
+    content = response.content
+    if 'charset=' in response.headers.get('content-type', '').lower() and response.encoding:
+        try:
+            return content.decode(response.encoding, errors='replace')
+        except LookupError:
+            pass
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode(response.apparent_encoding or 'utf-8', errors='replace')
+
+
+def fetch_page(url):
+    """GET a page through the shared session (gzip/deflate decoded transparently)"""
+    response = session.get(url, timeout=PAGE_TIMEOUT)
+    response.raise_for_status()
+    return FetchedPage(url, response.url, decode_html(response))
+
+
+def is_image(url):
+    """Cheap HEAD check that `url` serves an image"""
+    response = session.head(url, timeout=HEAD_TIMEOUT, allow_redirects=True)
+    return response.ok and 'image' in response.headers.get('content-type', '')
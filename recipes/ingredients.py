@@ -0,0 +1,279 @@
+"""
+Ingredient line parser.
+
+Turns free-text lines such as "1 1/2 cups flour, sifted", "½ tsp salt",
+"2-3 cloves garlic", "1 cup plus 2 tbsp sugar" or "a few sprigs thyme" into a
+quantity, a canonical unit, a name and notes. All
+patterns are compiled once at import; parse() is memoized because the same
+lines ("1 tsp salt") recur across recipes. Run `manage.py
+benchmark_ingredient_parser` to time it against a corpus of real lines.
+"""
+import re
+from decimal import Decimal
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+# Canonical unit -> spellings seen in the wild (matched case-insensitively,
+# with or without a trailing period)
+UNIT_ALIASES = {
+    'tsp': ('tsp', 'tsps', 'teaspoon', 'teaspoons', 'tea spoon'),
+    'tbsp': ('tbsp', 'tbsps', 'tbs', 'tbl', 'tblsp', 'tablespoon', 'tablespoons', 'table spoon'),
+    'cup': ('cup', 'cups', 'c'),
+    'fl oz': ('fl oz', 'fl. oz', 'fluid ounce', 'fluid ounces', 'floz'),
+    'pint': ('pint', 'pints', 'pt'),
+    'quart': ('quart', 'quarts', 'qt'),
+    'gallon': ('gallon', 'gallons', 'gal'),
+    'ml': ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+    'l': ('l', 'liter', 'liters', 'litre', 'litres'),
+    'g': ('g', 'gr', 'gram', 'grams', 'gramme', 'grammes'),
+    'kg': ('kg', 'kilogram', 'kilograms', 'kilo', 'kilos'),
+    'oz': ('oz', 'ounce', 'ounces'),
+    'lb': ('lb', 'lbs', 'pound', 'pounds'),
+    'pinch': ('pinch', 'pinches'),
+    'dash': ('dash', 'dashes'),
+    'clove': ('clove', 'cloves'),
+    'can': ('can', 'cans', 'tin', 'tins'),
+    'package': ('package', 'packages', 'pkg', 'packet', 'packets'),
+    'jar': ('jar', 'jars'),
+    'bottle': ('bottle', 'bottles'),
+    'slice': ('slice', 'slices'),
+    'stick': ('stick', 'sticks'),
+    'bunch': ('bunch', 'bunches'),
+    'sprig': ('sprig', 'sprigs'),
+    'head': ('head', 'heads'),
+    'handful': ('handful', 'handfuls'),
+    'piece': ('piece', 'pieces'),
+}
+# Canonical unit -> (base unit, base units per unit). Quantities are also
+# stored in their base unit so compatible units ("2 tbsp" and "1/8 cup") can
+# be summed by the database. Units missing here (can, pinch, ...) are their
+# own base; unit-less lines are counted.
+US_CUP_ML = Decimal('236.5882365')
+BASE_UNITS = {
+    'tsp': ('ml', US_CUP_ML / 48),
+    'tbsp': ('ml', US_CUP_ML / 16),
+    'fl oz': ('ml', US_CUP_ML / 8),
+    'cup': ('ml', US_CUP_ML),
+    'pint': ('ml', US_CUP_ML * 2),
+    'quart': ('ml', US_CUP_ML * 4),
+    'gallon': ('ml', US_CUP_ML * 16),
+    'ml': ('ml', Decimal('1')),
+    'l': ('ml', Decimal('1000')),
+    'g': ('g', Decimal('1')),
+    'kg': ('g', Decimal('1000')),
+    'oz': ('g', Decimal('28.3495')),
+    'lb': ('g', Decimal('453.592')),
+    '': ('count', Decimal('1')),
+}
+BASE_QUANTITY_PLACES = Decimal('0.001')
+# Convertible units, smallest first
+UNITS_BY_SIZE = sorted(BASE_UNITS, key=lambda unit: BASE_UNITS[unit][1])
+UNIT_LOOKUP = {alias: unit for unit, aliases in UNIT_ALIASES.items() for alias in aliases}
+# Cookbook shorthand where case matters: "1 T butter", "2 t vanilla"
+CASE_SENSITIVE_UNITS = {'T': 'tbsp', 't': 'tsp'}
+
+VULGAR_FRACTIONS = {
+    '½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4',
+    '⅕': '1/5', '⅖': '2/5', '⅗': '3/5', '⅘': '4/5', '⅙': '1/6',
+    '⅚': '5/6', '⅐': '1/7', '⅛': '1/8', '⅜': '3/8', '⅝': '5/8',
+    '⅞': '7/8', '⅑': '1/9', '⅒': '1/10',
+}
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+}
+# Vague amounts, shopped for as these counts; the phrase is kept as a note
+VAGUE_QUANTITIES = {'a few': 3, 'a couple': 2, 'several': 3}
+
+VULGAR_PATTERN = re.compile(r'(\d)?\s*([' + ''.join(VULGAR_FRACTIONS) + '])')
+NUMBER = r'(?:\d+ \d+/\d+|\d+/\d+|\d*\.\d+|\d+)'
+QUANTITY_PATTERN = re.compile(
+    rf'(?P<qty>{NUMBER}|(?:{"|".join(NUMBER_WORDS)})(?=\s))'
+    rf'(?:\s*(?:-|–|—|to|or)\s*(?P<qty_max>{NUMBER}))?\s*',
+    re.IGNORECASE
+)
+VAGUE_PATTERN = re.compile(
+    r'(?P<phrase>' + '|'.join(phrase.replace(' ', r'\s+') for phrase in VAGUE_QUANTITIES)
+    + r')(?:\s+of)?\s+',
+    re.IGNORECASE
+)
+# "1 cup plus 2 tbsp": a second amount added to the first
+PLUS_PATTERN = re.compile(rf'(?:\+|plus)\s*(?P<qty>{NUMBER})\s+', re.IGNORECASE)
+SIZE_PATTERN = re.compile(r'\(\s*([^)]*?)\s*\)\s*')
+UNIT_PATTERN = re.compile(
+    r'(?P<unit>' + '|'.join(re.escape(alias) for alias in sorted(UNIT_LOOKUP, key=len, reverse=True))
+    + r')\.?(?=[\s,)]|$)\s*',
+    re.IGNORECASE
+)
+CASE_SENSITIVE_UNIT_PATTERN = re.compile(r'(?P<unit>[Tt])\.?(?=\s)\s*')
+OF_PATTERN = re.compile(r'of\s+', re.IGNORECASE)
+PAREN_NOTE_PATTERN = re.compile(r'\s*\(([^)]*)\)')
+TRAILING_NOTE_PATTERN = re.compile(r'[\s,]*\b(to taste|as needed|optional|for serving|for garnish)\s*$', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+NAME_EDGE_PUNCTUATION = ' .,;:*-'
+NAME_MAX_LENGTH = 100
+SLASH_PATTERN = re.compile(r'\s*[/⁄]\s*')
+
+
+class ParsedIngredient(NamedTuple):
+    quantity: Optional[float]
+    quantity_max: Optional[float]
+    unit: str
+    name: str
+    notes: str
+    raw: str
+
+    @property
+    def amount(self):
+        """Quantity to shop for: the top of a range, 1 when none was given"""
+        if self.quantity_max is not None:
+            return self.quantity_max
+        return self.quantity if self.quantity is not None else 1.0
+
+
+def _to_number(text):
+    text = text.lower()
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    whole, _, fraction = text.rpartition(' ') if '/' in text else ('', '', text)
+    if '/' in fraction:
+        numerator, denominator = fraction.split('/')
+        value = float(numerator) / float(denominator) if float(denominator) else 0.0
+    else:
+        value = float(fraction)
+    return value + float(whole) if whole.strip() else value
+
+
+def format_quantity(value):
+    """Render a parsed quantity without a trailing .0"""
+    return f'{value:g}'
+
+
+def _expand_fractions(match):
+    whole, fraction = match.groups()
+    return f'{whole} {VULGAR_FRACTIONS[fraction]}' if whole else VULGAR_FRACTIONS[fraction]
+
+
+def _match_unit(text, position):
+    """(canonical unit, end) of a unit starting at `position`, or None"""
+    match = UNIT_PATTERN.match(text, position)
+    if match:
+        return UNIT_LOOKUP[match['unit'].lower().rstrip('.')], match.end()
+    match = CASE_SENSITIVE_UNIT_PATTERN.match(text, position)
+    if match:
+        return CASE_SENSITIVE_UNITS[match['unit']], match.end()
+    return None
+
+
+def _convert(quantity, unit, to_unit):
+    """`quantity` of `unit` expressed in `to_unit`, or None if they don't convert"""
+    if unit == to_unit:
+        return quantity
+    if unit in BASE_UNITS and to_unit in BASE_UNITS and BASE_UNITS[unit][0] == BASE_UNITS[to_unit][0]:
+        return quantity * float(BASE_UNITS[unit][1] / BASE_UNITS[to_unit][1])
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse(line):
+    """Parse one ingredient line into a ParsedIngredient"""
+    text = line
+    if not text.isascii():
+        text = VULGAR_PATTERN.sub(_expand_fractions, text)
+    text = SLASH_PATTERN.sub('/', WHITESPACE.sub(' ', text)).strip()
+    notes = []
+
+    quantity = quantity_max = None
+    position = 0
+    vague = VAGUE_PATTERN.match(text)
+    match = None if vague else QUANTITY_PATTERN.match(text)
+    if vague:
+        phrase = WHITESPACE.sub(' ', vague['phrase'].lower())
+        quantity = float(VAGUE_QUANTITIES[phrase])
+        notes.append(phrase)
+        position = vague.end()
+    elif match:
+        try:
+            quantity = _to_number(match['qty'])
+            if match['qty_max']:
+                quantity_max = _to_number(match['qty_max'])
+            position = match.end()
+        except ValueError:
+            quantity = quantity_max = None
+        # "1-1/2 cups" is a hyphenated mixed number, not a range down to ½
+        if quantity_max is not None and quantity_max < min(quantity, 1) and quantity.is_integer():
+            quantity, quantity_max = quantity + quantity_max, None
+
+    unit = ''
+    if quantity is not None:
+        size = SIZE_PATTERN.match(text, position)
+        if size:
+            notes.append(size[1])
+            position = size.end()
+        found = _match_unit(text, position)
+        if found:
+            unit, position = found
+            plus = PLUS_PATTERN.match(text, position)
+            extra = _match_unit(text, plus.end()) if plus else None
+            if extra:
+                extra_quantity = _to_number(plus['qty'])
+                added = _convert(extra_quantity, extra[0], unit)
+                if added is None:
+                    notes.append(f'plus {format_quantity(extra_quantity)} {extra[0]}')
+                else:
+                    quantity += added
+                    if quantity_max is not None:
+                        quantity_max += added
+                position = extra[1]
+            of = OF_PATTERN.match(text, position)
+            if of:
+                position = of.end()
+
+    name = text[position:]
+    name, _, comment = name.partition(',')
+    trailing = TRAILING_NOTE_PATTERN.search(name)
+    if trailing:
+        name = name[:trailing.start()]
+        notes.append(trailing[1].lower())
+    for note in PAREN_NOTE_PATTERN.findall(name):
+        notes.append(note.strip())
+    name = PAREN_NOTE_PATTERN.sub('', name).strip(' -')
+    if comment.strip():
+        notes.append(comment.strip())
+    if quantity_max is not None:
+        notes.insert(0, f'{format_quantity(quantity)}-{format_quantity(quantity_max)}')
+
+    # A bare amount ("1 1/3 cup") leaves the name empty rather than naming an
+    # ingredient after its quantity
+    return ParsedIngredient(quantity, quantity_max, unit, name, '; '.join(note for note in notes if note), line)
+
+
+def normalize_name(name):
+    """Key under which ingredient names are deduplicated ("Fresh  Basil." -> "fresh basil")"""
+    return WHITESPACE.sub(' ', name).strip(NAME_EDGE_PUNCTUATION).lower()[:NAME_MAX_LENGTH]
+
+
+def canonical_unit(unit):
+    """Canonical spelling of a stored unit ("Cups" -> "cup"); unknown units are kept as they are"""
+    if unit in CASE_SENSITIVE_UNITS:
+        return CASE_SENSITIVE_UNITS[unit]
+    return UNIT_LOOKUP.get(unit.strip().lower().rstrip('.'), unit)
+
+
+def to_base(quantity, unit):
+    """(base_quantity, base_unit) for a quantity in any spelling of a unit"""
+    unit = canonical_unit(unit)
+    base_unit, factor = BASE_UNITS.get(unit, (unit, Decimal('1')))
+    return (Decimal(quantity) * factor).quantize(BASE_QUANTITY_PLACES), base_unit
+
+
+def from_base(base_quantity, base_unit, unit):
+    """Express a base quantity in `unit` (one of the same base unit)"""
+    unit = canonical_unit(unit)
+    factor = BASE_UNITS[unit][1] if BASE_UNITS.get(unit, (None,))[0] == base_unit else Decimal('1')
+    return Decimal(base_quantity) / factor
+
+
+def parse_many(lines):
+    """Parse a recipe's ingredient lines, skipping blanks"""
+    return [parse(line) for line in lines if line and line.strip()]
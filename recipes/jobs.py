@@ -0,0 +1,79 @@
+"""
+Background execution of ExtractionJob rows (see run_extraction_jobs).
+
+A claimed job holds a lease of LEASE from its started_at. If its worker
+dies, the job is queued again once the lease runs out, and failed after
+MAX_ATTEMPTS claims so pollers always see it finish.
+"""
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ExtractionJob
+from .services import RecipeExtractionService
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=10)
+MAX_ATTEMPTS = 3
+
+
+def release_stale_jobs():
+    """Requeue running jobs whose lease expired, failing those out of attempts"""
+    now = timezone.now()
+    stale = ExtractionJob.objects.filter(status='running', started_at__lt=now - LEASE)
+    failed = stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status='failed', finished_at=now,
+        result={'error': 'Extraction worker stopped responding', 'status': 'Failed to extract recipe'})
+    requeued = stale.update(status='queued')
+    if failed or requeued:
+        logger.warning(f"Released stale extraction jobs: {requeued} requeued, {failed} failed")
+    return requeued + failed
+
+
+def claim_jobs(batch_size=1):
+    """Mark up to `batch_size` queued jobs as running and return them"""
+    with transaction.atomic():
+        jobs = list(
+            ExtractionJob.objects.select_for_update(skip_locked=True)
+            .filter(status='queued')
+            .order_by('created_at', 'id')[:batch_size]
+        )
+        for job in jobs:
+            job.status = 'running'
+            job.started_at = timezone.now()
+            job.attempts += 1
+            job.messages = job.messages + [{'status': 'Extracting recipe...', 'intermediate': True}]
+        ExtractionJob.objects.bulk_update(jobs, ['status', 'started_at', 'attempts', 'messages'])
+    return jobs
+
+
+def run_job(job):
+    """Run one claimed job, persisting each status message as it happens"""
+    try:
+        for message in RecipeExtractionService.import_steps(job.user, job.url):
+            job.messages = job.messages + [message]
+            if message.get('intermediate'):
+                job.save(update_fields=['messages'])
+            else:
+                job.result = message
+        succeeded = bool(job.result and job.result.get('id'))
+        job.recipe_id = job.result.get('id') if succeeded else None
+        job.status = 'succeeded' if succeeded else 'failed'
+    except Exception as e:
+        logger.error(f"Extraction job {job.id} crashed: {str(e)}")
+        job.result = {'error': str(e), 'status': 'Failed to extract recipe'}
+        job.messages = job.messages + [job.result]
+        job.status = 'failed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['messages', 'result', 'recipe', 'status', 'finished_at'])
+    return job
+
+
+def process_batch(batch_size=1):
+    release_stale_jobs()
+    jobs = claim_jobs(batch_size)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from recipes.models import GroceryItem, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = ('Fill base_quantity/base_unit on recipe ingredients and grocery items left without one '
+            '(migration 0011 fills existing rows); use --all to recompute after the conversion table changed')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every row, e.g. after the conversion table changed')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for model in (RecipeIngredient, GroceryItem):
+            queryset = model.objects.only('id', 'quantity', 'unit').order_by('id')
+            if not options['all']:
+                queryset = queryset.filter(base_quantity__isnull=True)
+            total = 0
+            last_id = 0
+            while True:
+                # Keyset batches, so rows filled by a batch don't shift the next one
+                batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                for row in batch:
+                    row.set_base_quantity()
+                model.objects.bulk_update(batch, ['base_quantity', 'base_unit'])
+                total += len(batch)
+                last_id = batch[-1].id
+            self.stdout.write(self.style.SUCCESS(f'Backfilled {total} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,54 @@
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from recipes.ingredients import parse, parse_many
+
+CORPUS = Path(__file__).resolve().parents[2] / 'data' / 'ingredient_lines.txt'
+
+
+class Command(BaseCommand):
+    help = 'Time the ingredient parser over a corpus of real ingredient lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(CORPUS),
+                            help='File with one ingredient line per line')
+        parser.add_argument('--rounds', type=int, default=200)
+        parser.add_argument('--recipe-size', type=int, default=30,
+                            help='Lines per simulated recipe')
+        parser.add_argument('--show', action='store_true',
+                            help='Print how each corpus line parses')
+
+    def handle(self, *args, **options):
+        lines = [line for line in Path(options['corpus']).read_text(encoding='utf-8').splitlines() if line.strip()]
+        size = options['recipe_size']
+        recipes = [lines[start:start + size] for start in range(0, len(lines), size)]
+
+        if options['show']:
+            for parsed in parse_many(lines):
+                self.stdout.write(f'{parsed.raw!r} -> {parsed.quantity} {parsed.quantity_max} '
+                                  f'{parsed.unit!r} {parsed.name!r} {parsed.notes!r}')
+
+        # Cold: memo cleared before every recipe, so each line is really parsed
+        cold = 0.0
+        for _ in range(options['rounds']):
+            for recipe in recipes:
+                parse.cache_clear()
+                start = time.perf_counter()
+                parse_many(recipe)
+                cold += time.perf_counter() - start
+
+        # Warm: repeated lines are served from the memo, as in a busy import
+        warm_start = time.perf_counter()
+        for _ in range(options['rounds']):
+            for recipe in recipes:
+                parse_many(recipe)
+        warm = time.perf_counter() - warm_start
+
+        parsed_lines = len(lines) * options['rounds']
+        per_recipe = options['rounds'] * len(recipes)
+        self.stdout.write(f'{len(lines)} lines, {len(recipes)} recipes of up to {size} lines, '
+                          f'{options["rounds"]} rounds')
+        self.stdout.write(f'cold: {cold / parsed_lines * 1e6:.1f} us/line, '
+                          f'{cold / per_recipe * 1e3:.3f} ms/recipe')
+        self.stdout.write(self.style.SUCCESS(
+            f'warm: {warm / parsed_lines * 1e6:.2f} us/line, {warm / per_recipe * 1e3:.4f} ms/recipe'))
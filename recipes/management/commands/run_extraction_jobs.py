@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from recipes.jobs import process_batch
+
+
+class Command(BaseCommand):
+    help = 'Run queued recipe extraction jobs off the request path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Jobs claimed per poll; run several processes for parallelism')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for jobs instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep between polls when the queue is empty')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            handled = process_batch(options['batch_size'])
+            total += handled
+            if handled:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {total} extraction jobs'))
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-17 15:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_recipe_image_url'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='recipe_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+import re
+
+from django.db import migrations, models
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_name(name):
+    # Frozen copy of recipes.ingredients.normalize_name
+    return WHITESPACE.sub(' ', name).strip(' .,;:*-').lower()[:100]
+
+
+def merge_duplicates(apps, schema_editor):
+    """Fill normalized_name and fold ingredients that normalize alike into the oldest one"""
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    GroceryItem = apps.get_model('recipes', 'GroceryItem')
+
+    keepers = {}
+    duplicates = {}
+    for ingredient in Ingredient.objects.order_by('id').only('id', 'name').iterator():
+        key = normalize_name(ingredient.name)
+        if key in keepers:
+            duplicates[ingredient.id] = keepers[key]
+        else:
+            keepers[key] = ingredient.id
+            Ingredient.objects.filter(id=ingredient.id).update(normalized_name=key)
+
+    for duplicate_id, keeper_id in duplicates.items():
+        # A recipe listing both spellings keeps the keeper's row
+        RecipeIngredient.objects.filter(
+            ingredient_id=duplicate_id,
+            recipe__ingredients__ingredient_id=keeper_id
+        ).delete()
+        RecipeIngredient.objects.filter(ingredient_id=duplicate_id).update(ingredient_id=keeper_id)
+        GroceryItem.objects.filter(ingredient_id=duplicate_id).update(ingredient_id=keeper_id)
+    Ingredient.objects.filter(id__in=list(duplicates)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_extractionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='normalized_name',
+            field=models.CharField(editable=False, max_length=100, null=True),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
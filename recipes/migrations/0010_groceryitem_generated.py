@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_alter_ingredient_normalized_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groceryitem',
+            name='generated',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
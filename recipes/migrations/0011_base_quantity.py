@@ -0,0 +1,102 @@
+# Generated by Django 5.0.1 on 2026-10-17 16:16
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Frozen copy of recipes.ingredients.BASE_UNITS / canonical_unit / to_base.
+# Only units with a base conversion need their aliases here; any other unit is
+# its own base either way.
+UNIT_ALIASES = {
+    'tsp': ('tsp', 'tsps', 'teaspoon', 'teaspoons', 'tea spoon'),
+    'tbsp': ('tbsp', 'tbsps', 'tbs', 'tbl', 'tblsp', 'tablespoon', 'tablespoons', 'table spoon'),
+    'cup': ('cup', 'cups', 'c'),
+    'fl oz': ('fl oz', 'fl. oz', 'fluid ounce', 'fluid ounces', 'floz'),
+    'pint': ('pint', 'pints', 'pt'),
+    'quart': ('quart', 'quarts', 'qt'),
+    'gallon': ('gallon', 'gallons', 'gal'),
+    'ml': ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'),
+    'l': ('l', 'liter', 'liters', 'litre', 'litres'),
+    'g': ('g', 'gr', 'gram', 'grams', 'gramme', 'grammes'),
+    'kg': ('kg', 'kilogram', 'kilograms', 'kilo', 'kilos'),
+    'oz': ('oz', 'ounce', 'ounces'),
+    'lb': ('lb', 'lbs', 'pound', 'pounds'),
+}
+UNIT_LOOKUP = {alias: unit for unit, aliases in UNIT_ALIASES.items() for alias in aliases}
+CASE_SENSITIVE_UNITS = {'T': 'tbsp', 't': 'tsp'}
+US_CUP_ML = Decimal('236.5882365')
+BASE_UNITS = {
+    'tsp': ('ml', US_CUP_ML / 48),
+    'tbsp': ('ml', US_CUP_ML / 16),
+    'fl oz': ('ml', US_CUP_ML / 8),
+    'cup': ('ml', US_CUP_ML),
+    'pint': ('ml', US_CUP_ML * 2),
+    'quart': ('ml', US_CUP_ML * 4),
+    'gallon': ('ml', US_CUP_ML * 16),
+    'ml': ('ml', Decimal('1')),
+    'l': ('ml', Decimal('1000')),
+    'g': ('g', Decimal('1')),
+    'kg': ('g', Decimal('1000')),
+    'oz': ('g', Decimal('28.3495')),
+    'lb': ('g', Decimal('453.592')),
+    '': ('count', Decimal('1')),
+}
+
+
+def canonical_unit(unit):
+    if unit in CASE_SENSITIVE_UNITS:
+        return CASE_SENSITIVE_UNITS[unit]
+    return UNIT_LOOKUP.get(unit.strip().lower().rstrip('.'), unit)
+
+
+def to_base(quantity, unit):
+    unit = canonical_unit(unit)
+    base_unit, factor = BASE_UNITS.get(unit, (unit, Decimal('1')))
+    return (Decimal(quantity) * factor).quantize(Decimal('0.001')), base_unit
+
+
+def fill_base_quantities(apps, schema_editor, batch_size=1000):
+    """Express every existing recipe ingredient and grocery item in its base unit"""
+    for model_name in ('RecipeIngredient', 'GroceryItem'):
+        model = apps.get_model('recipes', model_name)
+        queryset = model.objects.only('id', 'quantity', 'unit').order_by('id')
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for row in batch:
+                row.base_quantity, row.base_unit = to_base(row.quantity, row.unit)
+            model.objects.bulk_update(batch, ['base_quantity', 'base_unit'])
+            last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_groceryitem_generated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groceryitem',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=3, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='groceryitem',
+            name='base_unit',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=3, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='base_unit',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(fill_base_quantities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    "CREATE INDEX recipe_search_idx ON recipes_recipe USING gin (("
+    "setweight(to_tsvector('english', recipes_recipe.title), 'A') || "
+    "setweight(to_tsvector('english', recipes_recipe.description), 'B') || "
+    "setweight(to_tsvector('english', recipes_recipe.instructions), 'C')))",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS recipe_search_idx",
+]
+
+# FTS5 shadow table over the searchable columns, kept in sync by triggers
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5("
+    "title, description, instructions, content='recipes_recipe', content_rowid='id')",
+    "CREATE TRIGGER recipes_recipe_fts_ai AFTER INSERT ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(rowid, title, description, instructions) "
+    "VALUES (new.id, new.title, new.description, new.instructions); END",
+    "CREATE TRIGGER recipes_recipe_fts_ad AFTER DELETE ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, title, description, instructions) "
+    "VALUES ('delete', old.id, old.title, old.description, old.instructions); END",
+    "CREATE TRIGGER recipes_recipe_fts_au AFTER UPDATE OF title, description, instructions ON recipes_recipe BEGIN "
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, title, description, instructions) "
+    "VALUES ('delete', old.id, old.title, old.description, old.instructions); "
+    "INSERT INTO recipes_recipe_fts(rowid, title, description, instructions) "
+    "VALUES (new.id, new.title, new.description, new.instructions); END",
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ai",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_ad",
+    "DROP TRIGGER IF EXISTS recipes_recipe_fts_au",
+    "DROP TABLE IF EXISTS recipes_recipe_fts",
+]
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_base_quantity'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='extractioncacheentry',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_extractioncacheentry_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='extractionjob',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-17 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_extractionjob_attempts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionCacheCounter',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
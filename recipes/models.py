@@ -1,10 +1,15 @@
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Max, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.conf import settings
 import openai
-import requests
 from bs4 import BeautifulSoup
+from .http import fetch_page
+from .ingredients import (BASE_QUANTITY_PLACES, UNITS_BY_SIZE, from_base, normalize_name,
+                          parse_many, to_base)
 import logging
 import json
 
@@ -37,6 +42,11 @@ class Recipe(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='recipe_user_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -45,11 +55,10 @@ class Recipe(models.Model):
         """Extract recipe data from URL using OpenAI"""
         try:
             # Fetch webpage content
-            response = requests.get(url)
-            response.raise_for_status()
-            
+            page = fetch_page(url)
+
             # Parse HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
+            soup = BeautifulSoup(page.html, 'html.parser')
             
             # Remove script and style elements
             for script in soup(["script", "style"]):
@@ -89,43 +98,22 @@ class Recipe(models.Model):
             # Parse the response
             recipe_data = json.loads(response.choices[0].message.content)
             
-            # Create recipe instance
-            recipe = cls(
-                user=user,
-                title=recipe_data['title'],
-                description=recipe_data.get('description', ''),
-                instructions=recipe_data['instructions'],
-                prep_time=recipe_data.get('prep_time', 0),
-                cook_time=recipe_data.get('cook_time', 0),
-                servings=recipe_data.get('servings', 1),
-                source_url=url
-            )
-            recipe.save()
-
-            # Process ingredients
-            for ingredient_text in recipe_data['ingredients']:
-                # Split ingredient text into parts
-                parts = ingredient_text.split(' ', 2)
-                if len(parts) >= 3:
-                    quantity, unit, name = parts
-                else:
-                    quantity, unit, name = 1, 'unit', ingredient_text
-
-                try:
-                    quantity = float(quantity)
-                except ValueError:
-                    quantity = 1
-
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=name.strip()
-                )
-                
-                RecipeIngredient.objects.create(
-                    recipe=recipe,
-                    ingredient=ingredient,
-                    quantity=quantity,
-                    unit=unit
+            with transaction.atomic():
+                # Create recipe instance
+                recipe = cls(
+                    user=user,
+                    title=recipe_data['title'],
+                    description=recipe_data.get('description', ''),
+                    instructions=recipe_data['instructions'],
+                    prep_time=recipe_data.get('prep_time', 0),
+                    cook_time=recipe_data.get('cook_time', 0),
+                    servings=recipe_data.get('servings', 1),
+                    source_url=url
                 )
+                recipe.save()
+
+                # Process ingredients
+                RecipeIngredient.add_parsed(recipe, parse_many(recipe_data['ingredients']))
 
             return recipe, None
 
@@ -135,13 +123,70 @@ class Recipe(models.Model):
 
 class Ingredient(models.Model):
     name = models.CharField(max_length=100)
+    # Lower-cased, whitespace-collapsed name; one row per ingredient
+    normalized_name = models.CharField(max_length=100, unique=True, editable=False)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.name
 
-class RecipeIngredient(models.Model):
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_name'}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def resolve(cls, names):
+        """
+        Map each name to its Ingredient, creating missing ones: one IN lookup,
+        then one bulk insert that tolerates rows created concurrently and one
+        lookup for the inserted ids. Returns {normalized_name: Ingredient}.
+        """
+        wanted = {}
+        for name in names:
+            wanted.setdefault(normalize_name(name), name.strip()[:100])
+        found = {
+            ingredient.normalized_name: ingredient
+            for ingredient in cls.objects.filter(normalized_name__in=wanted)
+        }
+        missing = [key for key in wanted if key not in found]
+        if missing:
+            cls.objects.bulk_create(
+                [cls(name=wanted[key], normalized_name=key) for key in missing],
+                ignore_conflicts=True
+            )
+            found.update(
+                (ingredient.normalized_name, ingredient)
+                for ingredient in cls.objects.filter(normalized_name__in=missing)
+            )
+        return found
+
+class BaseQuantityModel(models.Model):
+    """
+    Keeps `quantity` `unit` also expressed in its base unit (ml, g, count or
+    the unit itself when it does not convert), so compatible amounts can be
+    summed in SQL. Bulk writers must call set_base_quantity() themselves.
+    """
+    base_quantity = models.DecimalField(max_digits=14, decimal_places=3, null=True, editable=False)
+    base_unit = models.CharField(max_length=50, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def set_base_quantity(self):
+        self.base_quantity, self.base_unit = to_base(self.quantity, self.unit)
+
+    def save(self, *args, **kwargs):
+        self.set_base_quantity()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'quantity', 'unit'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'base_quantity', 'base_unit'}
+        super().save(*args, **kwargs)
+
+class RecipeIngredient(BaseQuantityModel):
     recipe = models.ForeignKey(Recipe, related_name='ingredients', on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=8, decimal_places=2)
@@ -151,6 +196,40 @@ class RecipeIngredient(models.Model):
     class Meta:
         unique_together = ['recipe', 'ingredient']
 
+    @classmethod
+    def add_parsed(cls, recipe, parsed_lines):
+        """
+        Attach parsed ingredient lines to a new recipe with set-based writes.
+        Lines naming the same ingredient are merged (summed when the units
+        convert) since a recipe lists each ingredient once. Lines without an
+        ingredient name ("1/2 cup") are skipped.
+        """
+        skipped = [parsed.raw for parsed in parsed_lines if not normalize_name(parsed.name)]
+        if skipped:
+            logger.warning(f"Skipped ingredient lines without a name in recipe {recipe.id}: {skipped}")
+            parsed_lines = [parsed for parsed in parsed_lines if normalize_name(parsed.name)]
+        ingredients = Ingredient.resolve(parsed.name for parsed in parsed_lines)
+        rows = {}
+        for parsed in parsed_lines:
+            ingredient = ingredients[normalize_name(parsed.name)]
+            row = rows.get(ingredient.id)
+            if row is None:
+                row = rows[ingredient.id] = cls(
+                    recipe=recipe,
+                    ingredient=ingredient,
+                    quantity=Decimal(str(round(parsed.amount, 2))),
+                    unit=parsed.unit,
+                    notes=parsed.notes[:200]
+                )
+            else:
+                base_quantity, base_unit = to_base(parsed.amount, parsed.unit)
+                if base_unit == row.base_unit:
+                    row.quantity += round(from_base(base_quantity, base_unit, row.unit), 2)
+                else:
+                    row.notes = '; '.join(filter(None, [row.notes, parsed.raw]))[:200]
+            row.set_base_quantity()
+        return cls.objects.bulk_create(rows.values())
+
 class MealPlan(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     date = models.DateField()
@@ -176,10 +255,184 @@ class GroceryList(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-class GroceryItem(models.Model):
+    def meal_plan_totals(self):
+        """
+        Ingredient totals for the meal plans in this list's date window, each
+        recipe scaled by meal plan servings / recipe servings and summed per
+        ingredient and base unit by the database, so "2 tbsp" and "1/8 cup"
+        add up. Returns {(ingredient_id, base_unit): (base_quantity, unit)}
+        where `unit` is the largest unit the recipes used, for display.
+        Rows without a base quantity (not backfilled yet) can't be summed and
+        are left out.
+        """
+        scaled = ExpressionWrapper(
+            F('recipe__ingredients__base_quantity')
+            * Cast('servings', models.FloatField())
+            / Cast(Greatest('recipe__servings', 1), models.FloatField()),
+            output_field=models.FloatField()
+        )
+        largest_unit = Max(Case(
+            *[When(recipe__ingredients__unit=unit, then=Value(rank))
+              for rank, unit in enumerate(UNITS_BY_SIZE)],
+            default=Value(-1)
+        ))
+        rows = (
+            MealPlan.objects
+            .filter(user_id=self.user_id, date__range=(self.start_date, self.end_date),
+                    recipe__ingredients__base_quantity__isnull=False)
+            .values('recipe__ingredients__ingredient', 'recipe__ingredients__base_unit')
+            .annotate(total=Sum(scaled), unit_rank=largest_unit)
+            .order_by()
+        )
+        totals = {}
+        for row in rows:
+            base_unit = row['recipe__ingredients__base_unit']
+            unit = UNITS_BY_SIZE[row['unit_rank']] if row['unit_rank'] >= 0 else base_unit
+            base_quantity = Decimal(str(row['total'])).quantize(BASE_QUANTITY_PLACES)
+            totals[row['recipe__ingredients__ingredient'], base_unit] = (base_quantity, unit)
+        return totals
+
+    def generate_items(self):
+        """
+        Bring the generated items in line with the meal plans: create missing
+        ones, update changed quantities and drop those no longer needed.
+        Items added by hand are left alone. Returns counts per change.
+        """
+        with transaction.atomic():
+            # Concurrent regenerations of one list queue here, so each sees the
+            # items the previous one committed instead of creating duplicates
+            GroceryList.objects.select_for_update().get(pk=self.pk)
+            totals = self.meal_plan_totals()
+            existing = {
+                (item.ingredient_id, item.base_unit): item
+                for item in self.items.select_for_update().filter(generated=True)
+            }
+            changed = []
+            for key, item in existing.items():
+                if key not in totals or totals[key] == (item.base_quantity, item.unit):
+                    continue
+                base_quantity, unit = totals[key]
+                if item.base_quantity is None or base_quantity > item.base_quantity:
+                    # More is needed than what was bought
+                    item.purchased = False
+                item.set_from_base(base_quantity, key[1], unit)
+                changed.append(item)
+            created = []
+            for (ingredient_id, base_unit), (base_quantity, unit) in totals.items():
+                if (ingredient_id, base_unit) not in existing:
+                    item = GroceryItem(grocery_list=self, ingredient_id=ingredient_id, generated=True)
+                    item.set_from_base(base_quantity, base_unit, unit)
+                    created.append(item)
+            stale = [item.id for key, item in existing.items() if key not in totals]
+
+            GroceryItem.objects.bulk_create(created)
+            GroceryItem.objects.bulk_update(
+                changed, ['quantity', 'unit', 'base_quantity', 'base_unit', 'purchased'])
+            if stale:
+                GroceryItem.objects.filter(id__in=stale).delete()
+            if created or changed or stale:
+                self.save(update_fields=['updated_at'])
+        return {
+            'created': len(created),
+            'updated': len(changed),
+            'deleted': len(stale),
+            'unchanged': len(existing) - len(changed) - len(stale),
+        }
+
+class GroceryItem(BaseQuantityModel):
     grocery_list = models.ForeignKey(GroceryList, related_name='items', on_delete=models.CASCADE)
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
     quantity = models.DecimalField(max_digits=8, decimal_places=2)
     unit = models.CharField(max_length=50)
     purchased = models.BooleanField(default=False)
     notes = models.CharField(max_length=200, blank=True)
+    # Maintained by GroceryList.generate_items; items added by hand stay False
+    generated = models.BooleanField(default=False, editable=False)
+
+    def set_from_base(self, base_quantity, base_unit, unit):
+        """Set an aggregated base quantity, displayed in `unit`"""
+        self.base_quantity, self.base_unit = base_quantity, base_unit
+        self.quantity = round(from_base(base_quantity, base_unit, unit), 2)
+        self.unit = unit
+
+
+class ExtractionCacheEntry(models.Model):
+    """
+    Recipe data extracted from a page, shared across users. Entries are keyed
+    either by canonical URL or by a hash of the page's reduced text
+    (see services.ExtractionCache).
+    """
+    LEVEL_CHOICES = [
+        ('url', 'Canonical URL'),
+        ('content', 'Page content hash'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES)
+    source_url = models.URLField(max_length=2000)
+    data = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.level}: {self.source_url}"
+
+
+class ExtractionCacheCounter(models.Model):
+    """
+    Hit and miss totals of the extraction cache, shared by every process
+    (see services.ExtractionCache.stats).
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+    @classmethod
+    def increment(cls, name, by=1):
+        if not cls.objects.filter(name=name).update(value=F('value') + by):
+            _, created = cls.objects.get_or_create(name=name, defaults={'value': by})
+            if not created:
+                cls.objects.filter(name=name).update(value=F('value') + by)
+
+
+class ExtractionJob(models.Model):
+    """
+    A recipe import queued by the API and run by `python manage.py
+    run_extraction_jobs`. `messages` keeps every status update so clients can
+    poll or replay them over SSE.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    FINISHED = ('succeeded', 'failed')
+    QUEUED_MESSAGE = {'status': 'Queued', 'intermediate': True}
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    url = models.URLField(max_length=2000)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    messages = models.JSONField(default=list, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    recipe = models.ForeignKey(Recipe, null=True, blank=True, on_delete=models.SET_NULL)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='extractionjob_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in self.FINISHED
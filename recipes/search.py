@@ -0,0 +1,135 @@
+"""
+Faceted full-text search over a user's recipes.
+
+Title, description and instructions are indexed together, title weighted
+highest. On PostgreSQL through a GIN index on RECIPE_TSVECTOR, on SQLite
+through the `recipes_recipe_fts` FTS5 table that triggers keep in sync (both
+created by migration 0012); other databases fall back to icontains. As with
+the journal search, an SQLite migration that rebuilds recipes_recipe drops
+those triggers and has to recreate them.
+
+Matching, ranking, ingredient and total-time filters all stay in SQL: one
+query counts matches per total-time bucket, one fetches the page and one
+counts ingredients over the matches for the facet list.
+"""
+import re
+from django.db import connection
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import RecipeIngredient
+
+# Must match the indexed expression exactly for PostgreSQL to use the index
+RECIPE_TSVECTOR = (
+    "setweight(to_tsvector('english', recipes_recipe.title), 'A') || "
+    "setweight(to_tsvector('english', recipes_recipe.description), 'B') || "
+    "setweight(to_tsvector('english', recipes_recipe.instructions), 'C')"
+)
+FTS_TABLE = 'recipes_recipe_fts'
+# bm25 column weights for title, description, instructions
+FTS_WEIGHTS = '10.0, 4.0, 1.0'
+
+# Upper bounds (minutes) of the total-time facet buckets; the last is open
+TOTAL_TIME_BUCKETS = (15, 30, 60)
+INGREDIENT_FACET_LIMIT = 20
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _match_postgresql(queryset, query):
+    # Self-contained subquery: the queryset is reused inside the facet query,
+    # where Django re-aliases recipes_recipe
+    matching = RawSQL(
+        f"SELECT id FROM recipes_recipe WHERE ({RECIPE_TSVECTOR}) @@ websearch_to_tsquery('english', %s)",
+        [query]
+    )
+    rank = RawSQL(f"ts_rank({RECIPE_TSVECTOR}, websearch_to_tsquery('english', %s))", [query],
+                  output_field=FloatField())
+    return queryset.filter(id__in=matching), rank
+
+
+def _match_sqlite(queryset, query):
+    # Quote every term so user input is never parsed as FTS5 syntax
+    terms = _TERM_RE.findall(query)
+    if not terms:
+        return queryset.none(), Value(0.0)
+    match = ' '.join(f'"{term}"' for term in terms)
+    matching = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}, {FTS_WEIGHTS}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = recipes_recipe.id",
+        [match], output_field=FloatField()
+    )
+    return queryset.filter(id__in=matching), rank
+
+
+def _match_fallback(queryset, query):
+    condition = (Q(title__icontains=query) | Q(description__icontains=query)
+                 | Q(instructions__icontains=query))
+    return queryset.filter(condition), Value(0.0)
+
+
+def search_recipes(queryset, query='', ingredient_ids=(), min_total_time=None,
+                   max_total_time=None, limit=20, offset=0):
+    """
+    Search `queryset` (the user's recipes, already shaped for the list
+    representation). Returns a dict with the match count, the page of
+    recipes (best match first, each with `rank` and `total_time`) and facet
+    counts for ingredients and total-time buckets over all matches.
+    Recipes must contain every ingredient in `ingredient_ids`.
+    """
+    queryset = queryset.annotate(total_time=F('prep_time') + F('cook_time'))
+    rank = Value(0.0)
+    if query:
+        match = {
+            'postgresql': _match_postgresql,
+            'sqlite': _match_sqlite,
+        }.get(connection.vendor, _match_fallback)
+        queryset, rank = match(queryset, query)
+    for ingredient_id in ingredient_ids:
+        queryset = queryset.filter(Exists(RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient_id=ingredient_id)))
+    if min_total_time is not None:
+        queryset = queryset.filter(total_time__gte=min_total_time)
+    if max_total_time is not None:
+        queryset = queryset.filter(total_time__lte=max_total_time)
+
+    # Match count and total-time facet in one aggregate
+    buckets = {'count': Count('id')}
+    lower = None
+    for upper in TOTAL_TIME_BUCKETS:
+        condition = Q(total_time__lte=upper) if lower is None else Q(total_time__gt=lower, total_time__lte=upper)
+        buckets[f'time_{upper}'] = Count('id', filter=condition)
+        lower = upper
+    buckets['time_over'] = Count('id', filter=Q(total_time__gt=lower))
+    counts = queryset.order_by().aggregate(**buckets)
+
+    results = list(
+        queryset.annotate(rank=rank).order_by('-rank', '-created_at', '-id')[offset:offset + limit]
+    ) if counts['count'] else []
+
+    ingredient_facets = list(
+        RecipeIngredient.objects.filter(recipe__in=queryset.order_by().values('id'))
+        .values('ingredient_id', 'ingredient__name')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'ingredient__name')[:INGREDIENT_FACET_LIMIT]
+    ) if counts['count'] else []
+
+    time_facets = []
+    lower = 0
+    for upper in TOTAL_TIME_BUCKETS:
+        time_facets.append({'min': lower, 'max': upper, 'count': counts[f'time_{upper}']})
+        lower = upper
+    time_facets.append({'min': lower, 'max': None, 'count': counts['time_over']})
+
+    return {
+        'count': counts['count'],
+        'results': results,
+        'facets': {
+            'ingredients': [
+                {'id': facet['ingredient_id'], 'name': facet['ingredient__name'], 'count': facet['count']}
+                for facet in ingredient_facets
+            ],
+            'total_time': time_facets,
+        },
+    }
@@ -1,19 +1,31 @@
 from rest_framework import serializers
-from .models import Recipe, Ingredient, RecipeIngredient, MealPlan, GroceryList, GroceryItem
+from .models import Recipe, Ingredient, RecipeIngredient, MealPlan, GroceryList, GroceryItem, ExtractionJob
+from main.serializers import DynamicFieldsMixin
+from .ingredients import normalize_name
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ['id', 'name', 'description']
 
-class RecipeIngredientSerializer(serializers.ModelSerializer):
+    def validate_name(self, value):
+        existing = Ingredient.objects.filter(normalized_name=normalize_name(value))
+        if self.instance is not None:
+            existing = existing.exclude(pk=self.instance.pk)
+        if existing.exists():
+            raise serializers.ValidationError('An ingredient with this name already exists.')
+        return value
+
+class RecipeIngredientSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     ingredient_name = serializers.CharField(source='ingredient.name', read_only=True)
     
     class Meta:
         model = RecipeIngredient
-        fields = ['id', 'ingredient', 'ingredient_name', 'quantity', 'unit', 'notes']
+        fields = ['id', 'ingredient', 'ingredient_name', 'quantity', 'unit', 'notes',
+                  'base_quantity', 'base_unit']
+        read_only_fields = ['base_quantity', 'base_unit']
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(many=True, read_only=True)
     
     class Meta:
@@ -21,9 +33,29 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'instructions', 'prep_time', 
                  'cook_time', 'servings', 'source_url', 'image_url', 'ingredients',
                  'created_at', 'updated_at']
+        expandable_fields = ['ingredients']
         read_only_fields = ['created_at', 'updated_at']
 
-class MealPlanSerializer(serializers.ModelSerializer):
+class RecipeListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Card representation for recipe lists; ingredients and instructions are only sent on retrieve"""
+    ingredient_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Recipe
+        model_fields = ['id', 'title', 'prep_time', 'cook_time', 'servings',
+                        'source_url', 'image_url', 'created_at', 'updated_at']
+        fields = model_fields + ['ingredient_count']
+        read_only_fields = fields
+
+class RecipeSearchResultSerializer(RecipeListSerializer):
+    total_time = serializers.IntegerField(read_only=True)
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeListSerializer.Meta):
+        fields = RecipeListSerializer.Meta.fields + ['total_time', 'rank']
+        read_only_fields = fields
+
+class MealPlanSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     recipe_title = serializers.CharField(source='recipe.title', read_only=True)
     
     class Meta:
@@ -32,19 +64,29 @@ class MealPlanSerializer(serializers.ModelSerializer):
                  'servings', 'notes', 'created_at']
         read_only_fields = ['created_at']
 
-class GroceryItemSerializer(serializers.ModelSerializer):
+class GroceryItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     ingredient_name = serializers.CharField(source='ingredient.name', read_only=True)
     
     class Meta:
         model = GroceryItem
         fields = ['id', 'ingredient', 'ingredient_name', 'quantity', 
-                 'unit', 'purchased', 'notes']
+                 'unit', 'purchased', 'notes', 'generated', 'base_quantity', 'base_unit']
+        read_only_fields = ['generated', 'base_quantity', 'base_unit']
 
-class GroceryListSerializer(serializers.ModelSerializer):
+class GroceryListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     items = GroceryItemSerializer(many=True, read_only=True)
     
     class Meta:
         model = GroceryList
         fields = ['id', 'name', 'start_date', 'end_date', 'items', 
                  'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at'] 
\ No newline at end of file
+        expandable_fields = ['items']
+        read_only_fields = ['created_at', 'updated_at'] 
+
+class ExtractionJobSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = ExtractionJob
+        fields = ['id', 'url', 'status', 'messages', 'result', 'recipe',
+                 'created_at', 'started_at', 'finished_at']
+        read_only_fields = ['status', 'messages', 'result', 'recipe',
+                           'created_at', 'started_at', 'finished_at']
@@ -1,32 +1,174 @@
 import logging
-from urllib.request import urlopen, Request
+import hashlib
+import random
+import re
+from datetime import timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from recipe_scrapers import scrape_html
 import openai
 from bs4 import BeautifulSoup
-import requests
 import json
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import ExtractionCacheCounter, ExtractionCacheEntry, Recipe, RecipeIngredient
+from .http import HEADERS, fetch_page, is_image
+from .ingredients import parse_many
 
 logger = logging.getLogger(__name__)
 client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
 
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src)$', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+
+def canonicalize_url(url):
+    """
+    Normalize a recipe URL so trivially different links share a cache entry:
+    lower-case host without `www.`, no fragment, no tracking parameters,
+    sorted query and no trailing slash.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not TRACKING_PARAMS.match(key)
+    ))
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit(('https', host, path, query, ''))
+
+
+def reduce_page_text(soup):
+    """Visible text of a page with whitespace collapsed, as sent to the LLM"""
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return WHITESPACE.sub(' ', soup.get_text()).strip()
+
+
+class ExtractionCache:
+    """
+    Cross-user cache of extracted recipe data with two levels: canonical URL,
+    checked before any fetch, and a hash of the reduced page text, checked
+    before the LLM call. Entries expire after TTL and the least recently used
+    ones are evicted beyond MAX_ENTRIES, swept on a sample of stores since
+    lookups already ignore expired rows.
+    """
+    TTL = timedelta(days=30)
+    MAX_ENTRIES = 5000
+    EVICT_PROBABILITY = 0.02
+    STATS_KEYS = ('hits', 'misses')
+
+    @staticmethod
+    def url_key(url):
+        return hashlib.sha256(f'url:{canonicalize_url(url)}'.encode()).hexdigest()
+
+    @staticmethod
+    def content_key(text):
+        return hashlib.sha256(f'content:{text}'.encode()).hexdigest()
+
+    @classmethod
+    def _count(cls, outcome, by=1):
+        if by:
+            ExtractionCacheCounter.increment(outcome, by)
+
+    @classmethod
+    def stats(cls):
+        counters = dict(ExtractionCacheCounter.objects.filter(
+            name__in=cls.STATS_KEYS).values_list('name', 'value'))
+        return {outcome: counters.get(outcome, 0) for outcome in cls.STATS_KEYS}
+
+    @classmethod
+    def get(cls, key):
+        entry = ExtractionCacheEntry.objects.filter(
+            key=key, created_at__gte=timezone.now() - cls.TTL
+        ).only('id', 'data').first()
+        if entry is None:
+            cls._count('misses')
+            return None
+        ExtractionCacheEntry.objects.filter(id=entry.id).update(
+            hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+        cls._count('hits')
+        return dict(entry.data)
+
+    @classmethod
+    def get_url(cls, url):
+        return cls.get(cls.url_key(url))
+
+    @classmethod
+    def get_many_urls(cls, urls):
+        """URL-level lookup of several URLs in one query; returns {url: data} for the hits"""
+        keys = {url: cls.url_key(url) for url in urls}
+        entries = {
+            entry.key: entry for entry in ExtractionCacheEntry.objects.filter(
+                key__in=set(keys.values()), created_at__gte=timezone.now() - cls.TTL
+            ).only('id', 'key', 'data')
+        }
+        if entries:
+            ExtractionCacheEntry.objects.filter(id__in=[entry.id for entry in entries.values()]).update(
+                hit_count=F('hit_count') + 1, last_used_at=timezone.now())
+        found = {url: dict(entries[key].data) for url, key in keys.items() if key in entries}
+        cls._count('hits', len(found))
+        cls._count('misses', len(urls) - len(found))
+        return found
+
+    @classmethod
+    def get_content(cls, text):
+        return cls.get(cls.content_key(text))
+
+    @classmethod
+    def has_url(cls, url):
+        return ExtractionCacheEntry.objects.filter(
+            key=cls.url_key(url), created_at__gte=timezone.now() - cls.TTL).exists()
+
+    @classmethod
+    def store(cls, key, level, url, data):
+        data = {k: v for k, v in data.items() if k not in ('id', 'status', 'save_error')}
+        ExtractionCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'level': level,
+                'source_url': url,
+                'data': data,
+                'created_at': timezone.now(),
+                'last_used_at': timezone.now(),
+            }
+        )
+        if random.random() < cls.EVICT_PROBABILITY:
+            cls.evict()
+
+    @classmethod
+    def store_url(cls, url, data):
+        cls.store(cls.url_key(url), 'url', url, data)
+
+    @classmethod
+    def store_content(cls, text, url, data):
+        cls.store(cls.content_key(text), 'content', url, data)
+
+    @classmethod
+    def evict(cls):
+        """Drop expired entries and the least recently used ones beyond MAX_ENTRIES"""
+        ExtractionCacheEntry.objects.filter(created_at__lt=timezone.now() - cls.TTL).delete()
+        overflow = ExtractionCacheEntry.objects.order_by('-last_used_at').values_list(
+            'id', flat=True)[cls.MAX_ENTRIES:cls.MAX_ENTRIES + 1000]
+        overflow = list(overflow)
+        if overflow:
+            ExtractionCacheEntry.objects.filter(id__in=overflow).delete()
+
 class RecipeExtractionService:
-    # Common headers to mimic a real browser
-    HEADERS = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Connection': 'keep-alive',
-    }
+    HEADERS = HEADERS
 
     @staticmethod
-    def extract_with_scraper(url):
+    def extract_with_scraper(url, page=None):
         """Try to extract recipe data using recipe-scrapers"""
         try:
             logger.info(f"Attempting to use recipe-scrapers on {url}")
-            req = Request(url, headers=RecipeExtractionService.HEADERS)
-            html = urlopen(req).read().decode("utf-8")
-            scraper = scrape_html(html, org_url=url)
+            page = page or fetch_page(url)
+            scraper = scrape_html(page.html, org_url=url)
             
             # Get image URL from scraper
             image_url = None
@@ -58,14 +200,13 @@ class RecipeExtractionService:
             return {'success': False, 'error': str(e)}
 
     @staticmethod
-    def extract_with_openai(url):
+    def extract_with_openai(url, page=None):
         """Extract recipe data using OpenAI as fallback"""
         try:
             logger.info(f"Attempting to extract recipe with OpenAI from {url}")
-            response = requests.get(url, headers=RecipeExtractionService.HEADERS)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
+            page = page or fetch_page(url)
+
+            soup = BeautifulSoup(page.html, 'html.parser')
             
             # Enhanced image extraction strategy
             image_url = None
@@ -168,8 +309,7 @@ class RecipeExtractionService:
                             image_url = '/'.join(url.split('/')[:3]) + image_url
                         
                         # Validate image URL
-                        img_response = requests.head(image_url, headers=RecipeExtractionService.HEADERS, timeout=5)
-                        if not img_response.ok or 'image' not in img_response.headers.get('content-type', ''):
+                        if not is_image(image_url):
                             image_url = None
                 except Exception as e:
                     logger.warning(f"Image validation failed: {str(e)}")
@@ -178,12 +318,14 @@ class RecipeExtractionService:
             logger.info(f"Image extraction result: {'Success' if image_url else 'Failed'}")
 
             # Clean up text content for OpenAI
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            text = ' '.join(line for line in lines if line)
+            text = reduce_page_text(soup)
+
+            # Same page content seen before (other URL, mirror, etc.): skip the LLM
+            cached = ExtractionCache.get_content(text)
+            if cached:
+                logger.info("Reusing cached extraction for identical page content")
+                cached['image_url'] = cached.get('image_url') or image_url
+                return {'success': True, 'data': cached}
 
             system_prompt = """You are a helpful assistant that extracts recipe information from web pages.
             Extract the following information and return it in JSON format. For all time values, return integers only (no text).
@@ -240,6 +382,8 @@ class RecipeExtractionService:
                 'image_url': image_url
             }
 
+            ExtractionCache.store_content(text, url, recipe_data)
+
             logger.info("Successfully extracted recipe with OpenAI")
             return {
                 'success': True,
@@ -254,18 +398,34 @@ class RecipeExtractionService:
     def extract_from_url(cls, url):
         """Extract recipe data using scrapers with OpenAI fallback"""
         logger.info(f"Starting recipe extraction from {url}")
-        
-        # Try recipe-scrapers first
-        result = cls.extract_with_scraper(url)
-        
-        # If recipe-scrapers fails, try OpenAI
-        if not result['success']:
-            logger.info(f"Recipe scraper failed for {url}, trying OpenAI")
-            # Send status update before trying OpenAI
-            result['status'] = 'Recipe-Scraper Failed - Searching with OpenAI...'
-            # Try OpenAI
-            result = cls.extract_with_openai(url)
-            
+
+        cached = ExtractionCache.get_url(url)
+        if cached:
+            logger.info(f"Using cached extraction for {url}")
+            result = {'success': True, 'data': cached}
+        else:
+            try:
+                page = fetch_page(url)
+            except Exception as e:
+                logger.error(f"Failed to fetch {url}: {str(e)}")
+                page = None
+                result = {'success': False, 'error': str(e)}
+
+            if page:
+                # Try recipe-scrapers first
+                result = cls.extract_with_scraper(url, page=page)
+
+                # If recipe-scrapers fails, try OpenAI
+                if not result['success']:
+                    logger.info(f"Recipe scraper failed for {url}, trying OpenAI")
+                    # Send status update before trying OpenAI
+                    result['status'] = 'Recipe-Scraper Failed - Searching with OpenAI...'
+                    # Try OpenAI
+                    result = cls.extract_with_openai(url, page=page)
+
+            if result['success']:
+                ExtractionCache.store_url(url, result['data'])
+
         if result['success']:
             logger.info(f"Successfully extracted recipe from {url} using {result['data']['source']}")
             result['data']['status'] = (
@@ -281,4 +441,119 @@ class RecipeExtractionService:
                     'status': 'Failed to extract recipe'
                 }
             
-        return result 
\ No newline at end of file
+        return result 
+
+    @classmethod
+    def extract_steps(cls, url):
+        """
+        Extract a recipe without consulting the URL cache: one download, then
+        recipe-scrapers with the OpenAI fallback. A generator that yields
+        intermediate status dicts and returns the result dict.
+        """
+        # Download the page once for both extraction stages
+        try:
+            page = fetch_page(url)
+        except Exception as e:
+            logger.error(f"Failed to fetch {url}: {str(e)}")
+            return {'success': False, 'error': str(e), 'data': None}
+
+        # Try recipe-scrapers first
+        result = cls.extract_with_scraper(url, page=page)
+
+        if not result['success']:
+            # Send intermediate status
+            yield {
+                'status': 'Recipe-Scraper Failed - Searching with OpenAI...',
+                'intermediate': True
+            }
+
+            # Try OpenAI
+            result = cls.extract_with_openai(url, page=page)
+        return result
+
+    @classmethod
+    def extract(cls, url):
+        """Run extract_steps to completion, dropping the status messages"""
+        steps = cls.extract_steps(url)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+
+    @classmethod
+    def save_recipe(cls, user, url, recipe_data):
+        """
+        Save extracted `recipe_data` as a recipe of `user`. Returns the data
+        with the new recipe `id` and a status message, or a `save_error`.
+        """
+        try:
+            # Clean up servings - ensure it's an integer
+            servings = recipe_data.get('servings')
+            if isinstance(servings, str):
+                # Extract numbers from string (e.g., "4 servings" -> 4)
+                try:
+                    servings = int(''.join(filter(str.isdigit, servings)))
+                except ValueError:
+                    servings = 1
+            elif not isinstance(servings, (int, float)):
+                servings = 1
+            else:
+                servings = int(servings)  # Convert float to int if needed
+
+            # The recipe and all its ingredients are written together or not at all
+            with transaction.atomic():
+                recipe = Recipe.objects.create(
+                    user=user,
+                    title=recipe_data['title'],
+                    description=recipe_data.get('description', ''),
+                    instructions=recipe_data['instructions'],
+                    prep_time=recipe_data.get('prep_time', 0),
+                    cook_time=recipe_data.get('cook_time', 0),
+                    servings=max(1, servings),  # Ensure at least 1 serving
+                    source_url=url,
+                    image_url=recipe_data.get('image_url') or None  # Convert empty string to None
+                )
+                RecipeIngredient.add_parsed(recipe, parse_many(recipe_data['ingredients']))
+
+            # Add recipe ID and success status to response
+            recipe_data['id'] = recipe.id
+            recipe_data['status'] = (
+                'Successfully saved recipe using recipe-scraper!'
+                if recipe_data['source'] == 'recipe-scrapers'
+                else 'Successfully saved recipe using OpenAI!'
+            )
+
+        except Exception as e:
+            logger.error(f"Error saving recipe: {str(e)}")
+            recipe_data['save_error'] = str(e)
+        return recipe_data
+
+    @classmethod
+    def import_steps(cls, user, url):
+        """
+        Run the full import for `user` (cache, recipe-scrapers, OpenAI fallback,
+        save) as a generator of status dicts. Intermediate updates carry
+        `intermediate: True`; the last item is the final result.
+        """
+        # Another user may have imported this recipe already
+        cached = ExtractionCache.get_url(url)
+        if cached:
+            result = {'success': True, 'data': cached}
+        else:
+            result = yield from cls.extract_steps(url)
+            if result['success']:
+                ExtractionCache.store_url(url, result['data'])
+
+        if result['success']:
+            cls.save_recipe(user, url, result['data'])
+
+        # Ensure we always have a data key with at least error info
+        if not result.get('data'):
+            result['data'] = {
+                'error': result.get('error', 'Unknown error occurred'),
+                'status': 'Failed to extract recipe'
+            }
+
+        # Send final result
+        yield result['data']
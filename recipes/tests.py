@@ -1,3 +1,350 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from rest_framework.test import APIClient
+from rest_framework import status
+from unittest import mock
+from io import StringIO
+import requests
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
+from django.apps import apps
+from importlib import import_module
+from django.utils import timezone
+from .models import Recipe, Ingredient, RecipeIngredient, ExtractionJob, MealPlan, GroceryList, GroceryItem
+from .jobs import LEASE, MAX_ATTEMPTS, process_batch, release_stale_jobs
+from .services import ExtractionCache, RecipeExtractionService, canonicalize_url
+from .http import FetchedPage, decode_html
+from .ingredients import parse, parse_many
 
-# Create your tests here.
+SCRAPED_RECIPE = {
+    'title': 'Pancakes',
+    'description': 'Fluffy',
+    'ingredients': ['2 cups flour', '1 cup milk'],
+    'instructions': 'Mix and fry.',
+    'prep_time': 5,
+    'cook_time': 10,
+    'total_time': 15,
+    'servings': 4,
+    'image_url': None,
+    'source': 'recipe-scrapers',
+}
+
+
+class RecipeAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        fetch = mock.patch('recipes.services.fetch_page', side_effect=lambda url: FetchedPage(url, url, '<html></html>'))
+        self.fetch_page = fetch.start()
+        self.addCleanup(fetch.stop)
+        self.user = User.objects.create_user(username='cook', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def extract(self, url):
+        response = self.client.post('/api/recipes/recipes/extract_from_url/', {'url': url}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        process_batch()
+        return ExtractionJob.objects.get(id=response.data['id']).result
+
+    def test_canonicalize_url(self):
+        self.assertEqual(
+            canonicalize_url('http://www.Example.com/pancakes/?utm_source=x&b=2&a=1#step-3'),
+            'https://example.com/pancakes?a=1&b=2'
+        )
+
+    def test_ingredient_parser(self):
+        parsed = parse_many(['1 1/2 cups flour, sifted', '½ tsp salt', '2-3 cloves garlic',
+                             '1-1/2 Tbsp. butter', '1 (14 oz) can tomatoes', '', 'Salt to taste'])
+        self.assertEqual([(p.quantity, p.unit, p.name) for p in parsed], [
+            (1.5, 'cup', 'flour'), (0.5, 'tsp', 'salt'), (2.0, 'clove', 'garlic'),
+            (1.5, 'tbsp', 'butter'), (1.0, 'can', 'tomatoes'), (None, '', 'Salt'),
+        ])
+        self.assertEqual(parsed[0].notes, 'sifted')
+        self.assertEqual((parsed[2].amount, parsed[2].notes), (3.0, '2-3'))
+        self.assertEqual(parsed[4].notes, '14 oz')
+        self.assertEqual((parsed[5].amount, parsed[5].notes), (1.0, 'to taste'))
+        self.assertEqual(parse('2 T butter').unit, 'tbsp')
+
+        # Amounts without an ingredient leave the name empty
+        self.assertEqual([parse(line).name for line in ('1 ⅓ cup', '1/2 c', '3 l')], ['', '', ''])
+
+        # Compound amounts and vague quantities must not leak into the name
+        plus = parse('1 cup plus 2 tbsp flour')
+        self.assertEqual((plus.quantity, plus.unit, plus.name), (1.125, 'cup', 'flour'))
+        mixed = parse('1 lb plus 2 cups broth')
+        self.assertEqual((mixed.quantity, mixed.unit, mixed.name, mixed.notes), (1.0, 'lb', 'broth', 'plus 2 cup'))
+        few = parse('a few sprigs thyme')
+        self.assertEqual((few.quantity, few.unit, few.name, few.notes), (3.0, 'sprig', 'thyme', 'a few'))
+        couple = parse('A couple of eggs')
+        self.assertEqual((couple.quantity, couple.name, couple.notes), (2.0, 'eggs', 'a couple'))
+
+    def test_extraction_cache_shared_across_users(self):
+        scraper = mock.patch.object(
+            RecipeExtractionService, 'extract_with_scraper',
+            return_value={'success': True, 'data': dict(SCRAPED_RECIPE)})
+        with scraper as extract:
+            first = self.extract('https://example.com/pancakes?utm_source=feed')
+            other = User.objects.create_user(username='other', password='testpass123')
+            self.client.force_authenticate(other)
+            second = self.extract('https://www.example.com/pancakes/')
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(first['title'], second['title'])
+        self.assertEqual(Recipe.objects.filter(title='Pancakes').count(), 2)
+        self.assertEqual(RecipeIngredient.objects.filter(recipe__user=other).count(), 2)
+        # Counted in the database, so every worker reports the same totals
+        cache.clear()
+        self.assertEqual(ExtractionCache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_extraction_job(self):
+        response = self.client.post('/api/recipes/extraction-jobs/', {'url': 'https://example.com/pancakes'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job_id = response.data['id']
+        self.assertEqual(response.data['status'], 'queued')
+
+        # With sync workers a stream replays what is there and closes at once
+        response = self.client.get(f'/api/recipes/extraction-jobs/{job_id}/events/')
+        events = b''.join(response.streaming_content).decode().strip().split('\n\n')
+        self.assertEqual(events, ['retry: 1000', 'id: 0\ndata: {"status": "Queued", "intermediate": true}'])
+
+        with mock.patch.object(
+                RecipeExtractionService, 'extract_with_scraper',
+                return_value={'success': False, 'error': 'no schema'}), \
+             mock.patch.object(
+                RecipeExtractionService, 'extract_with_openai',
+                return_value={'success': True, 'data': dict(SCRAPED_RECIPE, source='openai')}):
+            self.assertEqual(process_batch(), 1)
+
+        response = self.client.get(f'/api/recipes/extraction-jobs/{job_id}/')
+        self.assertEqual(response.data['status'], 'succeeded')
+        self.assertEqual(response.data['recipe'], Recipe.objects.get().id)
+        self.assertEqual(response.data['result']['status'], 'Successfully saved recipe using OpenAI!')
+
+        # Streams reach gzip-accepting clients event by event, uncompressed
+        response = self.client.get(f'/api/recipes/extraction-jobs/{job_id}/events/',
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        chunks = iter(response.streaming_content)
+        self.assertEqual(next(chunks), b'retry: 1000\n\n')
+        events = (b'retry: 1000\n\n' + b''.join(chunks)).decode().strip().split('\n\n')
+        self.assertEqual(events[0], 'retry: 1000')
+        self.assertIn('Recipe-Scraper Failed', events[3])
+        self.assertTrue(events[-1].startswith('event: done'))
+
+    def test_stale_extraction_jobs_released(self):
+        expired = timezone.now() - LEASE - timedelta(minutes=1)
+        orphan = ExtractionJob.objects.create(
+            user=self.user, url='https://example.com/a', status='running', started_at=expired, attempts=1)
+        exhausted = ExtractionJob.objects.create(
+            user=self.user, url='https://example.com/b', status='running', started_at=expired,
+            attempts=MAX_ATTEMPTS)
+        alive = ExtractionJob.objects.create(
+            user=self.user, url='https://example.com/c', status='running', started_at=timezone.now(),
+            attempts=1)
+
+        self.assertEqual(release_stale_jobs(), 2)
+        for job in (orphan, exhausted, alive):
+            job.refresh_from_db()
+        self.assertEqual(orphan.status, 'queued')
+        self.assertEqual(exhausted.status, 'failed')
+        self.assertIsNotNone(exhausted.finished_at)
+        self.assertEqual(alive.status, 'running')
+
+    def test_page_decoding(self):
+        def response(body, content_type):
+            page = requests.Response()
+            page._content = body
+            page.headers['Content-Type'] = content_type
+            page.encoding = requests.utils.get_encoding_from_headers(page.headers)
+            return page
+
+        text = '<p>½ cup flour, crème</p>'
+        # No charset: requests would guess ISO-8859-1 and mangle UTF-8 pages
+        self.assertEqual(decode_html(response(text.encode(), 'text/html')), text)
+        self.assertEqual(decode_html(response(text.encode('latin-1'), 'text/html; charset=ISO-8859-1')), text)
+
+    def test_page_fetched_once_on_fallback(self):
+        with mock.patch('recipes.services.client') as openai_client:
+            openai_client.chat.completions.create.return_value.choices = [
+                mock.Mock(message=mock.Mock(content=json.dumps(SCRAPED_RECIPE)))]
+            result = self.extract('https://example.com/waffles')
+        self.assertEqual(result['title'], 'Pancakes')
+        self.assertEqual(self.fetch_page.call_count, 1)
+
+    def test_batch_import(self):
+        Recipe.objects.create(user=self.user, title='Old', instructions='-',
+                              servings=1, source_url='https://example.com/old')
+        ExtractionCache.store_url('https://example.com/cached', dict(SCRAPED_RECIPE, title='Waffles'))
+
+        def scrape(url, page=None):
+            if 'broken' in url:
+                return {'success': False, 'error': 'no recipe'}
+            return {'success': True, 'data': dict(SCRAPED_RECIPE, title=url.rsplit('/', 1)[-1])}
+
+        urls = ['https://example.com/old', 'https://example.com/cached',
+                'https://a.example/crepes', 'https://b.example/broken', 'https://a.example/crepes']
+        response = self.client.post('/api/recipes/recipes/batch_import/', {'urls': urls}, format='json')
+        # Nothing is fetched in the request
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(self.fetch_page.called)
+        results = {result['url']: result for result in response.data['results']}
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results['https://example.com/old']['status'], 'exists')
+        self.assertTrue(results['https://example.com/cached']['cached'])
+        self.assertEqual(results['https://a.example/crepes']['status'], 'queued')
+
+        with mock.patch.object(RecipeExtractionService, 'extract_with_scraper', side_effect=scrape), \
+                mock.patch.object(RecipeExtractionService, 'extract_with_openai',
+                                  return_value={'success': False, 'error': 'no recipe'}):
+            call_command('run_extraction_jobs', stdout=StringIO())
+        jobs = {job.url: job for job in ExtractionJob.objects.all()}
+        self.assertEqual(jobs['https://a.example/crepes'].id, results['https://a.example/crepes']['job'])
+        self.assertEqual(jobs['https://a.example/crepes'].recipe.title, 'crepes')
+        self.assertEqual(jobs['https://b.example/broken'].status, 'failed')
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 3)
+
+        response = self.client.post('/api/recipes/recipes/batch_import/', {'urls': ['not a url']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_save_recipe_is_set_based(self):
+        Ingredient.objects.create(name='Flour')
+        data = dict(SCRAPED_RECIPE, ingredients=[
+            '2 cups flour', '1 cup  FLOUR.', '1 tsp salt', '1/2 tsp Salt, divided', '1 ⅓ cup',
+        ] + [f'{n} g spice {n}' for n in range(1, 22)])
+        with CaptureQueriesContext(connection) as queries:
+            saved = RecipeExtractionService.save_recipe(self.user, 'https://example.com/bread', data)
+        self.assertNotIn('save_error', saved)
+        self.assertLessEqual(len(queries), 7)
+        rows = {row.ingredient.normalized_name: row for row in
+                RecipeIngredient.objects.filter(recipe_id=saved['id']).select_related('ingredient')}
+        self.assertEqual(len(rows), 23)
+        self.assertEqual(rows['flour'].quantity, 3)
+        self.assertEqual(rows['salt'].quantity, 1.5)
+        self.assertEqual(Ingredient.objects.filter(normalized_name='flour').count(), 1)
+        # The bare amount mints no ingredient
+        self.assertFalse(Ingredient.objects.filter(normalized_name__contains='cup').exists())
+
+    def test_recipe_list_is_slim_and_constant(self):
+        for n in range(3):
+            saved = RecipeExtractionService.save_recipe(
+                self.user, f'https://example.com/{n}', dict(SCRAPED_RECIPE, title=f'Recipe {n}'))
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/recipes/recipes/')
+        results = response.data['results']
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['ingredient_count'], 2)
+        self.assertNotIn('instructions', results[0])
+        self.assertNotIn('ingredients', results[0])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/recipes/recipes/{saved['id']}/")
+        self.assertEqual(response.data['ingredients'][0]['ingredient_name'], 'flour')
+
+    def test_generate_grocery_list_from_meal_plans(self):
+        data = dict(SCRAPED_RECIPE, ingredients=['2 cups flour', '1 tsp salt', '1 egg', '8 tbsp sugar'])
+        pancakes = Recipe.objects.get(id=RecipeExtractionService.save_recipe(
+            self.user, 'https://example.com/p', data)['id'])  # serves 4
+        bread = Recipe.objects.get(id=RecipeExtractionService.save_recipe(
+            self.user, 'https://example.com/b', dict(data, servings=2, ingredients=['1 cup flour', '1/4 cup sugar']))['id'])
+        MealPlan.objects.create(user=self.user, date=date(2026, 3, 2), recipe=pancakes, meal_type='breakfast', servings=2)
+        MealPlan.objects.create(user=self.user, date=date(2026, 3, 3), recipe=pancakes, meal_type='breakfast', servings=4)
+        MealPlan.objects.create(user=self.user, date=date(2026, 3, 3), recipe=bread, meal_type='dinner', servings=4)
+        MealPlan.objects.create(user=self.user, date=date(2026, 4, 1), recipe=bread, meal_type='dinner', servings=2)
+        grocery_list = GroceryList.objects.create(
+            user=self.user, name='Week', start_date=date(2026, 3, 1), end_date=date(2026, 3, 7))
+        manual = GroceryItem.objects.create(grocery_list=grocery_list, ingredient=Ingredient.objects.get(
+            normalized_name='salt'), quantity=1, unit='kg')
+        url = f'/api/recipes/grocery-lists/{grocery_list.id}/generate_from_meal_plan/'
+
+        response = self.client.post(url)
+        self.assertEqual(response.data['created'], 4)
+        items = {(item['ingredient_name'], item['unit']): item for item in response.data['items']}
+        # 2 cups * (2+4)/4 + 1 cup * 4/2
+        self.assertEqual(Decimal(items['flour', 'cup']['quantity']), Decimal('5.00'))
+        self.assertEqual(Decimal(items['salt', 'tsp']['quantity']), Decimal('1.50'))
+        self.assertEqual(Decimal(items['egg', '']['quantity']), Decimal('1.50'))
+        # 8 tbsp * 6/4 + 1/4 cup * 4/2 = 3/4 cup + 1/2 cup
+        self.assertEqual(Decimal(items['sugar', 'cup']['quantity']), Decimal('1.25'))
+
+        GroceryItem.objects.filter(grocery_list=grocery_list, unit='tsp').update(purchased=True)
+        MealPlan.objects.filter(recipe=bread).delete()
+        # Includes locking the list row before the totals are read
+        with self.assertNumQueries(9):
+            response = self.client.post(url)
+        self.assertEqual((response.data['updated'], response.data['deleted'], response.data['unchanged']), (2, 0, 2))
+        self.assertEqual(Decimal(GroceryItem.objects.get(grocery_list=grocery_list, unit='cup').quantity), Decimal('3.00'))
+        self.assertTrue(GroceryItem.objects.get(grocery_list=grocery_list, unit='tsp').purchased)
+        self.assertTrue(GroceryItem.objects.filter(id=manual.id).exists())
+
+        # Rows written without a base quantity are skipped rather than failing
+        RecipeIngredient.objects.filter(recipe=pancakes, unit='').update(base_quantity=None)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 1)
+
+    def test_legacy_units_sum_with_parsed_units(self):
+        pancakes = Recipe.objects.get(id=RecipeExtractionService.save_recipe(
+            self.user, 'https://example.com/p', dict(SCRAPED_RECIPE, ingredients=['1/8 cup milk']))['id'])
+        milk = Ingredient.objects.get(normalized_name='milk')
+        # Rows stored before units were parsed, as the 0011 backfill finds them
+        legacy = Recipe.objects.create(user=self.user, title='Legacy', servings=4)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=legacy, ingredient=milk, quantity=1, unit='Cups'),
+            RecipeIngredient(recipe=legacy, ingredient=Ingredient.objects.create(name='Salt', normalized_name='salt'),
+                             quantity=2, unit='T'),
+        ])
+        import_module('recipes.migrations.0011_base_quantity').fill_base_quantities(apps, None)
+        self.assertEqual(
+            sorted(RecipeIngredient.objects.filter(recipe=legacy).values_list('base_unit', 'base_quantity')),
+            [('ml', Decimal('29.574')), ('ml', Decimal('236.588'))])
+
+        for recipe in (pancakes, legacy):
+            MealPlan.objects.create(user=self.user, date=date(2026, 3, 2), recipe=recipe, meal_type='dinner', servings=4)
+        grocery_list = GroceryList.objects.create(
+            user=self.user, name='Week', start_date=date(2026, 3, 1), end_date=date(2026, 3, 7))
+        totals = grocery_list.meal_plan_totals()
+        # One line for 1/8 cup (stored as 0.12) + 1 cup
+        self.assertEqual(totals[milk.id, 'ml'], (Decimal('264.979'), 'cup'))
+        self.assertEqual(len(totals), 2)
+
+        # Saving through the model canonicalizes the same way
+        row = RecipeIngredient.objects.create(
+            recipe=legacy, ingredient=Ingredient.objects.create(name='Cream', normalized_name='cream'),
+            quantity=2, unit='cups.')
+        self.assertEqual((row.base_unit, row.base_quantity), ('ml', Decimal('473.176')))
+
+    def test_recipe_search_with_facets(self):
+        def save(title, instructions, ingredients, prep, cook):
+            data = dict(SCRAPED_RECIPE, title=title, instructions=instructions,
+                        ingredients=ingredients, prep_time=prep, cook_time=cook)
+            return RecipeExtractionService.save_recipe(self.user, f'https://example.com/{title}', data)['id']
+
+        save('Banana Pancakes', 'Whisk and fry the pancakes.', ['2 bananas', '1 cup flour'], 5, 10)
+        save('Lemon Cake', 'Bake like pancakes but taller.', ['1 lemon', '2 cups flour'], 20, 40)
+        save('Garlic Bread', 'Toast the bread.', ['3 cloves garlic', '1 loaf bread'], 5, 5)
+        other = User.objects.create_user(username='other', password='testpass123')
+        RecipeExtractionService.save_recipe(other, 'https://example.com/x', dict(SCRAPED_RECIPE, title='Pancakes'))
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/recipes/recipes/search/', {'q': 'pancakes'})
+        data = response.data
+        self.assertEqual(data['count'], 2)
+        # The title match outranks the instructions match
+        self.assertEqual([r['title'] for r in data['results']], ['Banana Pancakes', 'Lemon Cake'])
+        self.assertEqual(data['results'][0]['total_time'], 15)
+        self.assertEqual(data['facets']['ingredients'][0], {
+            'id': Ingredient.objects.get(normalized_name='flour').id, 'name': 'flour', 'count': 2})
+        self.assertEqual([bucket['count'] for bucket in data['facets']['total_time']], [1, 0, 1, 0])
+
+        flour = Ingredient.objects.get(normalized_name='flour').id
+        lemon = Ingredient.objects.get(normalized_name='lemon').id
+        response = self.client.get('/api/recipes/recipes/search/', {'ingredient': [flour, lemon]})
+        self.assertEqual([r['title'] for r in response.data['results']], ['Lemon Cake'])
+        response = self.client.get('/api/recipes/recipes/search/', {'max_time': 15})
+        self.assertEqual(response.data['count'], 2)
+        response = self.client.get('/api/recipes/recipes/search/', {'max_time': 'soon'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
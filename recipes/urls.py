@@ -7,6 +7,7 @@ router.register(r'recipes', views.RecipeViewSet, basename='recipe')
 router.register(r'ingredients', views.IngredientViewSet, basename='ingredient')
 router.register(r'meal-plans', views.MealPlanViewSet, basename='mealplan')
 router.register(r'grocery-lists', views.GroceryListViewSet, basename='grocerylist')
+router.register(r'extraction-jobs', views.ExtractionJobViewSet, basename='extractionjob')
 
 urlpatterns = [
     path('', include(router.urls)),
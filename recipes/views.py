@@ -3,49 +3,109 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Recipe, Ingredient, MealPlan, GroceryList, RecipeIngredient
-from .serializers import (RecipeSerializer, IngredientSerializer, 
-                         MealPlanSerializer, GroceryListSerializer)
+from .models import Recipe, Ingredient, MealPlan, GroceryList, RecipeIngredient, ExtractionJob
+from .serializers import (RecipeSerializer, RecipeListSerializer, RecipeSearchResultSerializer,
+                         IngredientSerializer,
+                         MealPlanSerializer, GroceryListSerializer, GroceryItemSerializer,
+                         ExtractionJobSerializer)
 from django.core.validators import URLValidator
 from django.core.exceptions import ValidationError
 import logging
-from urllib.request import urlopen
-from recipe_scrapers import scrape_html
-import openai
-from bs4 import BeautifulSoup
-import requests
 import json
 from django.conf import settings
-from .services import RecipeExtractionService
+from .services import RecipeExtractionService, ExtractionCache
+from . import batch
+from .search import search_recipes
+from main.pagination import CreatedAtCursorPagination
 from django.http import StreamingHttpResponse
+from django.db.models import Count, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+import time
 
 logger = logging.getLogger(__name__)
-client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
 
 # Create your views here.
 
 class RecipeViewSet(viewsets.ModelViewSet):
     serializer_class = RecipeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedAtCursorPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['title', 'prep_time', 'cook_time']
 
     def get_queryset(self):
-        return Recipe.objects.filter(user=self.request.user)
+        queryset = Recipe.objects.filter(user=self.request.user)
+        if self.action in ('list', 'search'):
+            # Only the columns the list shows, plus the ingredient count in the same query
+            return queryset.only(*RecipeListSerializer.Meta.model_fields).annotate(
+                ingredient_count=Coalesce(Subquery(
+                    RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by()
+                    .values('recipe').annotate(n=Count('id')).values('n')
+                ), 0)
+            )
+        if self.get_serializer_class().wants_field(self.request, 'ingredients'):
+            queryset = queryset.prefetch_related(Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ))
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return RecipeListSerializer
+        if self.action == 'search':
+            return RecipeSearchResultSerializer
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over title, description and instructions with
+        ingredient and total-time facets.
+        Query params: q, ingredient (id, repeatable; recipes must contain
+        all), min_time / max_time (total minutes), limit (default 20, max
+        100), offset.
+        """
+        params = request.query_params
+        try:
+            ingredient_ids = [int(value) for value in params.getlist('ingredient')]
+            min_time = int(params['min_time']) if params.get('min_time') else None
+            max_time = int(params['max_time']) if params.get('max_time') else None
+            limit = min(max(int(params.get('limit', 20)), 1), 100)
+            offset = max(int(params.get('offset', 0)), 0)
+        except ValueError:
+            return Response(
+                {"error": "ingredient, min_time, max_time, limit and offset must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        found = search_recipes(
+            self.get_queryset(),
+            query=params.get('q', '').strip(),
+            ingredient_ids=ingredient_ids,
+            min_total_time=min_time,
+            max_total_time=max_time,
+            limit=limit,
+            offset=offset,
+        )
+        return Response({
+            'count': found['count'],
+            'results': self.get_serializer(found['results'], many=True).data,
+            'facets': found['facets'],
+        })
+
     @action(detail=False, methods=['post'])
     def extract_from_url(self, request):
-        """Extract recipe data from URL using scrapers with OpenAI fallback"""
-        logger.info("=== Starting recipe extraction ===")
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request path: {request.path}")
-        logger.info(f"Request data: {request.data}")
-        
+        """
+        Queue the import of a recipe URL (scrapers with OpenAI fallback) and
+        return the ExtractionJob with 202, as POST /extraction-jobs/ does.
+        Poll the job until it finishes; its `recipe` is the saved recipe.
+        """
         url = request.data.get('url')
-        
+
         if not url:
             return Response(
                 {'error': 'URL is required'}, 
@@ -60,121 +120,47 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        def stream_response():
-            # Try recipe-scrapers first
-            result = RecipeExtractionService.extract_with_scraper(url)
-            
-            if not result['success']:
-                # Send intermediate status
-                yield json.dumps({
-                    'status': 'Recipe-Scraper Failed - Searching with OpenAI...',
-                    'intermediate': True
-                }) + '\n'
-                
-                # Try OpenAI
-                result = RecipeExtractionService.extract_with_openai(url)
-            
-            if result['success']:
-                try:
-                    # Clean up the data before saving
-                    recipe_data = result['data']
-                    
-                    # Clean up servings - ensure it's an integer
-                    servings = recipe_data.get('servings')
-                    if isinstance(servings, str):
-                        # Extract numbers from string (e.g., "4 servings" -> 4)
-                        try:
-                            servings = int(''.join(filter(str.isdigit, servings)))
-                        except ValueError:
-                            servings = 1
-                    elif not isinstance(servings, (int, float)):
-                        servings = 1
-                    else:
-                        servings = int(servings)  # Convert float to int if needed
-
-                    # Create recipe instance
-                    recipe = Recipe.objects.create(
-                        user=request.user,
-                        title=recipe_data['title'],
-                        description=recipe_data.get('description', ''),
-                        instructions=recipe_data['instructions'],
-                        prep_time=recipe_data.get('prep_time', 0),
-                        cook_time=recipe_data.get('cook_time', 0),
-                        servings=max(1, servings),  # Ensure at least 1 serving
-                        source_url=url,
-                        image_url=recipe_data.get('image_url') or None  # Convert empty string to None
-                    )
-
-                    # Process ingredients
-                    for ingredient_text in recipe_data['ingredients']:
-                        # Split ingredient text into parts
-                        parts = ingredient_text.split(' ', 2)
-                        
-                        if len(parts) >= 3:
-                            quantity, unit, name = parts
-                        elif len(parts) == 2:
-                            quantity, name = parts
-                            unit = ''
-                        else:
-                            quantity = '1'
-                            unit = ''
-                            name = ingredient_text
-
-                        # Convert quantity to decimal
-                        try:
-                            if '/' in quantity:
-                                if ' ' in quantity:  # Mixed number like "1 1/2"
-                                    whole, frac = quantity.split()
-                                    num, denom = frac.split('/')
-                                    quantity = float(whole) + float(num)/float(denom)
-                                else:  # Simple fraction like "1/2"
-                                    num, denom = quantity.split('/')
-                                    quantity = float(num)/float(denom)
-                            else:
-                                quantity = float(quantity)
-                        except (ValueError, ZeroDivisionError):
-                            quantity = 1.0
-
-                        # Create or get ingredient
-                        ingredient, _ = Ingredient.objects.get_or_create(
-                            name=name.strip()
-                        )
-                        
-                        # Create recipe ingredient
-                        RecipeIngredient.objects.create(
-                            recipe=recipe,
-                            ingredient=ingredient,
-                            quantity=quantity,
-                            unit=unit.strip()
-                        )
-
-                    # Add recipe ID and success status to response
-                    recipe_data['id'] = recipe.id
-                    recipe_data['status'] = (
-                        'Successfully saved recipe using recipe-scraper!'
-                        if recipe_data['source'] == 'recipe-scrapers'
-                        else 'Successfully saved recipe using OpenAI!'
-                    )
-                    
-                except Exception as e:
-                    logger.error(f"Error saving recipe: {str(e)}")
-                    recipe_data['save_error'] = str(e)
-
-            # Ensure we always have a data key with at least error info
-            if not result.get('data'):
-                result['data'] = {
-                    'error': result.get('error', 'Unknown error occurred'),
-                    'status': 'Failed to extract recipe'
-                }
+        job = ExtractionJob.objects.create(
+            user=request.user, url=url, messages=[dict(ExtractionJob.QUEUED_MESSAGE)])
+        return Response(ExtractionJobSerializer(job, context=self.get_serializer_context()).data,
+                        status=status.HTTP_202_ACCEPTED)
 
-            # Send final result
-            yield json.dumps(result['data'])
+    @action(detail=False, methods=['post'])
+    def batch_import(self, request):
+        """
+        Import several recipes. Takes {"urls": [...]} and returns one result
+        per URL: `exists`, `imported` (shared-cache hit) or `queued` with the
+        id of the ExtractionJob to poll. Answers 202 when any job was queued.
+        """
+        urls = request.data.get('urls')
+        if not isinstance(urls, list) or not urls:
+            return Response(
+                {'error': 'urls must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(urls) > batch.MAX_URLS:
+            return Response(
+                {'error': f'At most {batch.MAX_URLS} URLs per batch'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        response = StreamingHttpResponse(
-            streaming_content=stream_response(),
-            content_type='application/json'
-        )
-        return response
+        validate = URLValidator()
+        invalid = []
+        for url in urls:
+            try:
+                validate(url)
+            except (ValidationError, TypeError):
+                invalid.append(url)
+        if invalid:
+            return Response(
+                {'error': 'Invalid URL format', 'urls': invalid},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = batch.queue_many(request.user, urls)
+        queued = any(result['status'] == 'queued' for result in results)
+        return Response({'results': results},
+                        status=status.HTTP_202_ACCEPTED if queued else status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'])
     def check_url_exists(self, request):
@@ -206,7 +192,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 }
             })
         
-        return Response({'exists': False})
+        # Tell the client whether an import would be served from the shared cache
+        return Response({'exists': False, 'cached': ExtractionCache.has_url(url)})
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def extraction_cache_stats(self, request):
+        """Hit/miss counters of the shared extraction cache"""
+        return Response(ExtractionCache.stats())
+
+class ExtractionJobViewSet(viewsets.ModelViewSet):
+    """
+    Asynchronous recipe imports. POST {"url": ...} queues a job and returns
+    immediately; `run_extraction_jobs` does the work. Clients poll the job
+    (GET /extraction-jobs/<id>/) until it finishes; the `events` SSE stream
+    is an alternative for browsers.
+    """
+    serializer_class = ExtractionJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    http_method_names = ['get', 'post', 'head', 'options']
+
+    SSE_POLL_INTERVAL = 1.0
+    SSE_RETRY_MS = 1000
+
+    def get_queryset(self):
+        return ExtractionJob.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=request.user, messages=[dict(ExtractionJob.QUEUED_MESSAGE)])
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'])
+    def events(self, request, pk=None):
+        """
+        Server-sent events replaying the job's status messages, then following
+        new ones for at most settings.SSE_MAX_DURATION seconds. EventSource
+        clients reconnect after SSE_RETRY_MS, sending Last-Event-ID, until the
+        `done` event arrives.
+
+        Following a job holds a worker, so SSE_MAX_DURATION defaults to 0 for
+        the sync gunicorn workers of railway.json: each connection replays
+        what is new and closes, and the reconnects poll like GET does. Raise
+        it only with gthread or async workers.
+        """
+        job = self.get_object()
+        try:
+            sent = int(request.headers.get('Last-Event-ID', -1)) + 1
+        except ValueError:
+            sent = 0
+
+        def stream():
+            nonlocal sent
+            deadline = time.monotonic() + settings.SSE_MAX_DURATION
+            current = job
+            yield f"retry: {self.SSE_RETRY_MS}\n\n"
+            while True:
+                for index, message in enumerate(current.messages[sent:], start=sent):
+                    yield f"id: {index}\ndata: {json.dumps(message)}\n\n"
+                sent = len(current.messages)
+                if current.is_finished:
+                    yield f"event: done\ndata: {json.dumps({'status': current.status, 'recipe': current.recipe_id})}\n\n"
+                    return
+                if time.monotonic() > deadline:
+                    return
+                time.sleep(self.SSE_POLL_INTERVAL)
+                current = ExtractionJob.objects.only(
+                    'status', 'messages', 'recipe_id').get(pk=current.pk)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 class IngredientViewSet(viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
@@ -220,7 +277,10 @@ class MealPlanViewSet(viewsets.ModelViewSet):
     filterset_fields = ['date', 'meal_type']
 
     def get_queryset(self):
-        return MealPlan.objects.filter(user=self.request.user)
+        queryset = MealPlan.objects.filter(user=self.request.user)
+        if self.get_serializer_class().wants_field(self.request, 'recipe_title'):
+            queryset = queryset.select_related('recipe')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -230,13 +290,28 @@ class GroceryListViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return GroceryList.objects.filter(user=self.request.user)
+        queryset = GroceryList.objects.filter(user=self.request.user)
+        if self.action == 'generate_from_meal_plan':
+            # Items are reloaded after generation
+            return queryset
+        if self.get_serializer_class().wants_field(self.request, 'items'):
+            queryset = queryset.prefetch_related('items__ingredient')
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
     @action(detail=True, methods=['post'])
     def generate_from_meal_plan(self, request, pk=None):
+        """
+        Fill the list from the meal plans between its start and end dates.
+        Safe to repeat: only items whose totals changed are touched.
+        """
         grocery_list = self.get_object()
-        # Add logic to generate grocery list from meal plan
-        return Response({'status': 'Grocery list generated'})
+        changes = grocery_list.generate_items()
+        items = grocery_list.items.select_related('ingredient').order_by('ingredient__name', 'unit')
+        return Response({
+            'status': 'Grocery list generated',
+            **changes,
+            'items': GroceryItemSerializer(items, many=True, context=self.get_serializer_context()).data,
+        })